@@ -0,0 +1,74 @@
+class Alert:
+    """
+    One raised alert, kept for the rest of the run. Only a truncated body excerpt and a
+    capped list of header pairs stay in memory, the captured body itself is spooled to
+    disk and referenced by artifact. Plain tuples and strings keep it picklable, so
+    alerts cross from scan worker processes unchanged.
+    """
+
+    __slots__ = (
+        "site",
+        "endpoint",
+        "expected",
+        "received",
+        "detail",
+        "exception",
+        "nonce",
+        "excerpt",
+        "headers",
+        "artifact",
+        "latency_ms",
+        "percentiles",
+        "circuit_open",
+        "vantages",
+    )
+
+    def __init__(
+        self,
+        site,
+        endpoint,
+        exception,
+        expected,
+        received,
+        nonce,
+        excerpt=None,
+        headers=None,
+        artifact=None,
+        latency_ms=None,
+        percentiles=None,
+        circuit_open=False,
+        vantages=None,
+        detail=None,
+    ):
+        self.site = site
+        self.endpoint = endpoint
+        self.exception = exception
+        self.expected = expected
+        self.received = received
+        self.nonce = nonce
+        self.excerpt = excerpt
+        self.headers = headers
+        self.artifact = artifact
+        self.latency_ms = latency_ms
+        self.percentiles = percentiles
+        self.circuit_open = circuit_open
+        # Names of the vantage points that agreed on the failure, set by the collector
+        self.vantages = vantages
+        # What a failed content or header assertion found instead, received stays the status code
+        self.detail = detail
+
+    @property
+    def key(self):
+        return f"{self.site}{self.endpoint}"
+
+
+def compact_headers(headers, limit):
+    # Header pairs in response order, capped so a header-heavy response can't bloat the alert
+    if headers is None:
+        return None
+    pairs = []
+    for key, value in headers.items():
+        if len(pairs) >= limit:
+            break
+        pairs.append((str(key), str(value)))
+    return tuple(pairs)
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import shutil
+import time
+
+
+class ArtifactSpool:
+    """
+    Content-addressed directory of alert artifacts (response bodies, screenshots).
+    Files are named by the SHA-256 of their content, so identical error pages served by
+    thousands of endpoints are stored once. Every store refreshes the file's mtime, and
+    prune() deletes the least recently used files until the directory fits max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=200 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def store_text(self, text, suffix=".txt"):
+        return self.store_bytes(text.encode("utf-8"), suffix)
+
+    def store_bytes(self, data, suffix):
+        target = os.path.join(self.path, hashlib.sha256(data).hexdigest() + suffix)
+        if self.touch(target):
+            return target
+        # Written under a unique name first, scan workers may store the same content at once
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, target)
+        return target
+
+    def store_file(self, source, suffix):
+        # Moves a file (e.g. a fresh screenshot) into the spool
+        content_hash = hashlib.sha256()
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                content_hash.update(block)
+        target = os.path.join(self.path, content_hash.hexdigest() + suffix)
+        if self.touch(target):
+            os.remove(source)
+        else:
+            shutil.move(source, target)
+        return target
+
+    def touch(self, target):
+        try:
+            os.utime(target)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def prune(self, keep=()):
+        """
+        Deletes least recently used artifacts until the spool fits its size budget.
+        Paths in keep (still referenced by open alerts) are never deleted.
+        Returns the number of files removed.
+        """
+        files = []
+        total = 0
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith(".tmp"):
+                    # Left behind by a crashed writer
+                    if time.time() - stat.st_mtime > 3600:
+                        os.remove(entry.path)
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        removed = 0
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError as e:
+                print(f"❌ Error deleting {path}: {e}")
+        if removed:
+            print(f"🧹 Pruned {removed} artifact(s), spool is {total / 1024 / 1024:.1f} MB")
+        return removed
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import re
+
+
+# Part of every Assertions key, bumped when the shape of the failures changes so cached
+# verdicts in the older shape aren't reused
+VERDICT_FORMAT = 2
+
+
+class AssertionConfigError(ValueError):
+    pass
+
+
+class MultiPatternMatcher:
+    """
+    Finds which of a set of literal strings occur in a body, in one scan.
+    All patterns still to be found are combined into one alternation (longest first),
+    so the regex engine walks the text once and stops at the next position where any
+    of them starts. Every hit removes at least one pattern, so the number of Python-level
+    steps is bounded by the number of patterns, not by the size of the body.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(dict.fromkeys(patterns))
+        self.encoded = {}
+        self.regexes = {}
+
+    def __getstate__(self):
+        # Compiled alternations are rebuilt lazily, only the patterns go into the sites cache
+        return {"patterns": self.patterns}
+
+    def __setstate__(self, state):
+        self.__init__(state["patterns"])
+
+    def encode(self, encoding):
+        # Pattern bytes in the response's charset, falling back to UTF-8 if it can't represent them
+        encoded = self.encoded.get(encoding)
+        if encoded is None:
+            try:
+                encoded = [pattern.encode(encoding) for pattern in self.patterns]
+            except (LookupError, UnicodeEncodeError):
+                encoded = [pattern.encode("utf-8") for pattern in self.patterns]
+            self.encoded[encoding] = encoded
+        return encoded
+
+    def regex(self, encoding, remaining):
+        regex = self.regexes.get((encoding, remaining))
+        if regex is None:
+            encoded = self.encode(encoding)
+            alternatives = sorted((encoded[i] for i in remaining), key=len, reverse=True)
+            regex = self.regexes[(encoding, remaining)] = re.compile(b"|".join(re.escape(p) for p in alternatives))
+        return regex
+
+    def scan(self, data, encoding, remaining):
+        """
+        Returns the subset of pattern indexes in remaining that occur in data.
+        """
+        encoded = self.encode(encoding)
+        found = set()
+        position = 0
+        while remaining:
+            match = self.regex(encoding, remaining).search(data, position)
+            if match is None:
+                break
+            # Patterns that are prefixes of the longest match at this position match here too
+            hit = {i for i in remaining if data.startswith(encoded[i], match.start())}
+            found |= hit
+            remaining = remaining - hit
+            position = match.start() + 1
+        return found
+
+    def max_length(self, encoding):
+        return max((len(pattern) for pattern in self.encode(encoding)), default=0)
+
+
+JSON_PATH_TOKEN = re.compile(r"\.([A-Za-z_][\w-]*)|\[(\d+)\]|\[['\"](.+?)['\"]\]")
+
+
+def compile_json_path(path):
+    # "$.data.items[0]['some key']" -> ["data", "items", 0, "some key"]
+    if not path.startswith("$"):
+        raise AssertionConfigError(f"JSON path must start with $, got {path!r}")
+    steps = []
+    position = 1
+    while position < len(path):
+        match = JSON_PATH_TOKEN.match(path, position)
+        if match is None:
+            raise AssertionConfigError(f"invalid JSON path {path!r} at position {position}")
+        name, index, quoted = match.groups()
+        steps.append(int(index) if index is not None else name or quoted)
+        position = match.end()
+    return steps
+
+
+def resolve_json_path(document, steps):
+    value = document
+    for step in steps:
+        if isinstance(step, int):
+            if not isinstance(value, list) or step >= len(value):
+                raise KeyError(step)
+        elif not isinstance(value, dict) or step not in value:
+            raise KeyError(step)
+        value = value[step]
+    return value
+
+
+class Assertions:
+    """
+    Content and header expectations of one endpoint, compiled once when sites.json loads.
+
+    - dom_contains / contains: strings that must appear in the body
+    - not_contains: strings that must not appear in the body
+    - matches: regular expressions that must match the body
+    - json: {"$.path": expected value} checked against the parsed JSON body
+    - headers: {"Name": "substring"}, or true / false for present / absent
+
+    Literal strings are matched together by one MultiPatternMatcher while the body streams.
+    """
+
+    __slots__ = (
+        "dom_contains",
+        "required",
+        "forbidden",
+        "matcher",
+        "regexes",
+        "json_checks",
+        "header_checks",
+        "key",
+    )
+
+    def __init__(self, dom_contains=None, contains=(), not_contains=(), matches=(), json_checks=None, headers=None):
+        self.dom_contains = dom_contains
+        required = ([dom_contains] if dom_contains else []) + list(contains)
+        self.matcher = MultiPatternMatcher(required + list(not_contains))
+        index = {pattern: i for i, pattern in enumerate(self.matcher.patterns)}
+        self.required = frozenset(index[pattern] for pattern in required)
+        self.forbidden = frozenset(index[pattern] for pattern in not_contains)
+        if self.required & self.forbidden:
+            raise AssertionConfigError("a string can't be both required and forbidden")
+
+        try:
+            self.regexes = [(pattern, re.compile(pattern)) for pattern in matches]
+        except re.error as e:
+            raise AssertionConfigError(f"invalid regex: {e}")
+        self.json_checks = [(path, compile_json_path(path), value) for path, value in (json_checks or {}).items()]
+        self.header_checks = list((headers or {}).items())
+
+        # Identifies this set of assertions, e.g. to tell whether a cached verdict still applies
+        spec = [VERDICT_FORMAT, dom_contains, list(contains), list(not_contains), list(matches), json_checks, headers]
+        self.key = hashlib.sha1(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def needs_body(self):
+        return bool(self.matcher.patterns or self.regexes or self.json_checks)
+
+    def scanner(self, encoding):
+        return BodyScanner(self, encoding)
+
+    def check_headers(self, headers):
+        # Returns a list of (exception, expected, detail), detail being the offending value if any
+        failures = []
+        for name, expected in self.header_checks:
+            value = headers.get(name)
+            if expected is True and value is None:
+                failures.append((f"Header missing: {name}", True, None))
+            elif expected is False and value is not None:
+                failures.append((f"Unexpected header: {name}", False, str(value)))
+            elif isinstance(expected, str) and (value is None or expected not in value):
+                failures.append((f"Header mismatch: {name}", expected, None if value is None else str(value)))
+        return failures
+
+
+class BodyScanner:
+    """
+    Per-check state for streaming a body through an endpoint's Assertions.
+    Keeps the last (longest pattern - 1) bytes between chunks so a string split across
+    two chunks still matches, and buffers the body only if regexes or JSON checks need it.
+    """
+
+    def __init__(self, assertions, encoding):
+        self.assertions = assertions
+        self.encoding = encoding
+        self.overlap = max(0, assertions.matcher.max_length(encoding) - 1)
+        self.remaining = assertions.required | assertions.forbidden
+        self.found = set()
+        self.tail = b""
+        self.buffer = bytearray() if assertions.regexes or assertions.json_checks else None
+
+    @property
+    def complete(self):
+        # Reading further can't change the verdict
+        if self.buffer is not None or self.assertions.required - self.found:
+            return False
+        # Forbidden strings only matter until the first one turns up
+        return not self.assertions.forbidden or bool(self.assertions.forbidden & self.found)
+
+    def feed(self, chunk):
+        if self.buffer is not None:
+            self.buffer += chunk
+        if self.remaining:
+            window = self.tail + chunk
+            hit = self.assertions.matcher.scan(window, self.encoding, self.remaining)
+            self.found |= hit
+            self.remaining = self.remaining - hit
+            self.tail = window[max(0, len(window) - self.overlap):] if self.overlap else b""
+
+    def finish(self):
+        """
+        Returns a list of (exception, expected, detail) for every failed body assertion,
+        detail being a string describing what was found instead, or None.
+        """
+        assertions = self.assertions
+        patterns = assertions.matcher.patterns
+        failures = []
+        for i in sorted(assertions.required - self.found):
+            if patterns[i] == assertions.dom_contains:
+                failures.append(("DOM string mismatch", 0, None))
+            else:
+                failures.append((f"Required string missing: {patterns[i]}", patterns[i], None))
+        for i in sorted(assertions.forbidden & self.found):
+            failures.append((f"Forbidden string found: {patterns[i]}", patterns[i], None))
+
+        if self.buffer is None:
+            return failures
+
+        text = self.buffer.decode(self.encoding, errors="replace")
+        for pattern, regex in assertions.regexes:
+            if not regex.search(text):
+                failures.append((f"Regex not matched: {pattern}", pattern, None))
+
+        if assertions.json_checks:
+            try:
+                document = json.loads(text)
+            except ValueError as e:
+                failures.append(("Invalid JSON body", None, str(e)))
+                return failures
+            for path, steps, expected in assertions.json_checks:
+                try:
+                    value = resolve_json_path(document, steps)
+                except KeyError:
+                    failures.append((f"JSON path missing: {path}", expected, None))
+                    continue
+                if value != expected:
+                    failures.append((f"JSON value mismatch: {path}", expected, json.dumps(value, sort_keys=True)))
+        return failures
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Local fake target for benchmarks: answers every path with a configurable delay,
+status code, body size and failure rate.
+
+    python bench/fake_server.py --port=8099 --latency-ms=20 --jitter-ms=10 --body-bytes=20000 --failure-rate=0.01
+"""
+import asyncio
+import random
+import sys
+
+from aiohttp import web
+
+MARKER = "fake-target-ok"
+
+
+def get_cli_value(name, default):
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def create_app(latency_ms=20, jitter_ms=10, status=200, body_bytes=20000, failure_rate=0.0, seed=None):
+    """
+    Every response carries MARKER just before the end of the body, so dom_contains
+    checks have to read the whole page. A failure_rate fraction of requests get a 503.
+    """
+    rng = random.Random(seed)
+    filler = "x" * max(0, body_bytes - len(MARKER) - 30)
+    body = f"<html><body>{filler}{MARKER}</body></html>".encode("utf-8")
+
+    async def handle(request):
+        delay = max(0.0, rng.gauss(latency_ms, jitter_ms)) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+        if rng.random() < failure_rate:
+            return web.Response(status=503, text="Service Unavailable")
+        return web.Response(status=status, body=body, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handle)
+    return app
+
+
+def serve(host="127.0.0.1", port=8099, **options):
+    # Runs until killed, used as the target process of the scan benchmark
+    web.run_app(create_app(**options), host=host, port=port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    port = int(get_cli_value("port", 8099))
+    print(f"Fake target listening on http://127.0.0.1:{port}")
+    serve(
+        port=port,
+        latency_ms=float(get_cli_value("latency-ms", 20)),
+        jitter_ms=float(get_cli_value("jitter-ms", 10)),
+        status=int(get_cli_value("status", 200)),
+        body_bytes=int(get_cli_value("body-bytes", 20000)),
+        failure_rate=float(get_cli_value("failure-rate", 0.0)),
+    )
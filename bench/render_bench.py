@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Measures alert email render time and size for a large synthetic alert set.
+
+    python bench/render_bench.py --alerts=10000 --sites=50 --show-headers
+"""
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import Alert, compact_headers
+from render import CompiledTemplate, render_alerts
+
+EXCEPTIONS = [
+    ("Status code mismatch", 200, 503),
+    ("Status code mismatch", 200, 502),
+    ("DOM content not found: <div id=\"app\">", "<div id=\"app\">", 200),
+    ("Timeout", None, None),
+]
+
+
+def get_cli_value(name, default):
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def make_alerts(count, sites):
+    alerts = []
+    for i in range(count):
+        exception, expected, received = random.choice(EXCEPTIONS)
+        alerts.append(Alert(
+            f"site{i % sites}.example.com",
+            f"/path/{i}",
+            exception,
+            expected,
+            received,
+            uuid.uuid4().hex,
+            excerpt="<html>" + "x" * 1000 + "</html>",
+            headers=compact_headers({f"X-Header-{n}": "value" for n in range(60)}, 20),
+        ))
+    return alerts
+
+
+def main():
+    count = int(get_cli_value("alerts", 10000))
+    sites = int(get_cli_value("sites", 50))
+    show_headers = "--show-headers" in sys.argv
+    alerts = make_alerts(count, sites)
+
+    template_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "email-content.html")
+    with open(template_path) as f:
+        template = CompiledTemplate(f.read())
+
+    started = time.perf_counter()
+    referenced = set()
+    body = render_alerts(alerts, lambda site: count // sites, show_headers=show_headers, referenced=referenced)
+    html = template.render(
+        replace_alerts=body,
+        failure_count=count,
+        incident_start_timestamp_delta="5 minutes",
+        incident_start_timestamp_pretty="now",
+    )
+    elapsed = time.perf_counter() - started
+
+    print(f"alerts:          {count} across {sites} sites")
+    print(f"render time:     {elapsed * 1000:.1f} ms")
+    print(f"email size:      {len(html.encode('utf-8')) / 1024:.1f} KiB")
+    print(f"screenshots:     {len(referenced)} referenced")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Scan pipeline benchmark against a local fake target.
+
+Starts bench/fake_server.py in its own process, generates a synthetic sites.json for
+every inventory size, scans it in a fresh process and reports scan wall time, throughput,
+peak RSS, results store flush time and email render time. Results are written as JSON
+(bench/results/<commit>.json by default) so runs of different commits can be compared.
+
+    python bench/scan_bench.py --sizes=10,1000,10000,50000 --failure-rate=0.02
+    python bench/scan_bench.py --compare=bench/results/abc1234.json
+"""
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import fake_server
+
+
+def get_cli_value(name, default):
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def write_inventory(path, size, per_site, base_url):
+    # Every synthetic site points at the fake target, endpoints check the marker at the end of its body
+    sites = {}
+    for i in range(size):
+        site = sites.setdefault(f"site{i // per_site}.bench", {"check": True, "base_url": base_url, "endpoints": {}})
+        site["endpoints"][f"/page/{i}"] = {"status": 200, "dom_contains": fake_server.MARKER}
+    with open(path, "w") as f:
+        json.dump({"sites": sites}, f)
+
+
+def run_scan(workdir, engine, settings):
+    """
+    Runs in a fresh process so peak RSS only covers this scan. Imports run.py, points
+    its state files into workdir and times the scan, the results flush and the email render.
+    """
+    sys.stdout = open(os.devnull, "w")
+    import run
+
+    run.PARSER.read_dict({"DEFAULT": dict({
+        "SITES_FILE": os.path.join(workdir, "sites.json"),
+        "SITES_CACHE_FILE": os.path.join(workdir, "sites.cache"),
+        "RESULTS_DB": os.path.join(workdir, "results.db"),
+        "LATENCY_STATE_FILE": os.path.join(workdir, "latency.json"),
+        "CIRCUIT_STATE_FILE": os.path.join(workdir, "circuits.json"),
+        "RESPONSE_CACHE_FILE": os.path.join(workdir, "response_cache.json"),
+        "TMP_PATH_SCREENSHOTS": workdir,
+    }, **settings)})
+    run.RESULTS_STORE = run.open_results_store()
+    run.LATENCY_TRACKER = run.open_latency_tracker()
+    run.CIRCUITS = run.open_circuit_breakers()
+    run.RESPONSE_CACHE = run.open_response_cache()
+
+    started = time.perf_counter()
+    sites = run.get_sites_config()
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if engine == "serial":
+        run.do_heartbeat_check(sites)
+    else:
+        run.do_concurrent_heartbeat_check(sites)
+    scan_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    run.RESULTS_STORE.flush()
+    flush_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    html = run.get_email_template().render(
+        replace_alerts=run.get_email_markup(),
+        failure_count=len(run.ALERTS),
+        incident_start_timestamp_delta="0s",
+        incident_start_timestamp_pretty="now",
+    )
+    render_seconds = time.perf_counter() - started
+    run.RESULTS_STORE.close()
+
+    return {
+        "endpoints": len(sites),
+        "alerts": len(run.ALERTS),
+        "config_load_seconds": round(load_seconds, 4),
+        "scan_seconds": round(scan_seconds, 4),
+        "throughput_per_second": round(len(sites) / scan_seconds, 1) if scan_seconds else None,
+        "results_flush_seconds": round(flush_seconds, 4),
+        "email_render_seconds": round(render_seconds, 4),
+        "email_bytes": len(html.encode("utf-8")),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def check_port_free(port):
+    # Another process on the port would answer in place of the fake target and skew the results
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(("127.0.0.1", port))
+        except OSError as e:
+            raise RuntimeError(f"port {port} is already in use ({e.strerror}), pick another with --port")
+
+
+def wait_for_port(port, server, timeout=10):
+    # Only counts as started while our own server process is still alive
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not server.is_alive():
+            raise RuntimeError(f"fake target exited with code {server.exitcode} before listening on port {port}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                if server.is_alive():
+                    return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"fake target didn't start on port {port}")
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(previous_path, report):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    before = {run["endpoints"]: run for run in previous["runs"]}
+    print(f"\nCompared with {previous['commit']}:")
+    for run in report["runs"]:
+        old = before.get(run["endpoints"])
+        if old is None:
+            continue
+        for key in ("scan_seconds", "throughput_per_second", "peak_rss_mb", "email_render_seconds"):
+            if old.get(key):
+                change = (run[key] - old[key]) / old[key] * 100
+                print(f"  {run['endpoints']:>6} endpoints  {key:<24} {old[key]:>10} -> {run[key]:<10} ({change:+.1f}%)")
+
+
+def main():
+    sizes = [int(size) for size in get_cli_value("sizes", "10,1000,10000").split(",")]
+    engine = get_cli_value("engine", "concurrent")
+    port = int(get_cli_value("port", 8099))
+    server_options = {
+        "latency_ms": float(get_cli_value("latency-ms", 20)),
+        "jitter_ms": float(get_cli_value("jitter-ms", 10)),
+        "status": int(get_cli_value("status", 200)),
+        "body_bytes": int(get_cli_value("body-bytes", 20000)),
+        "failure_rate": float(get_cli_value("failure-rate", 0.01)),
+        "seed": 1,
+    }
+    concurrency = get_cli_value("concurrency", "100")
+    settings = {
+        "SCAN_CONCURRENCY": concurrency,
+        # Every synthetic site is the same local host, don't let the per-host limit serialize them
+        "SCAN_LIMIT_PER_HOST": concurrency,
+        "CONFIRM_RETRIES": get_cli_value("retries", "0"),
+    }
+
+    check_port_free(port)
+    context = multiprocessing.get_context("spawn")
+    server = context.Process(target=fake_server.serve, kwargs=dict(port=port, **server_options), daemon=True)
+    server.start()
+    runs = []
+    try:
+        wait_for_port(port, server)
+        for size in sizes:
+            with tempfile.TemporaryDirectory(prefix="monitor-bench-") as workdir:
+                write_inventory(os.path.join(workdir, "sites.json"), size, int(get_cli_value("per-site", 50)), f"http://127.0.0.1:{port}")
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(run_scan, workdir, engine, settings).result()
+            runs.append(result)
+            print(
+                f"{result['endpoints']:>6} endpoints: scan {result['scan_seconds']:.2f}s "
+                f"({result['throughput_per_second']}/s), peak RSS {result['peak_rss_mb']} MB, "
+                f"{result['alerts']} alerts rendered in {result['email_render_seconds'] * 1000:.1f} ms"
+            )
+    finally:
+        server.terminate()
+        server.join()
+
+    report = {
+        "commit": get_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "engine": engine,
+        "server": server_options,
+        "settings": settings,
+        "runs": runs,
+    }
+    output = get_cli_value("output", os.path.join(BENCH_DIR, "results", f"{report['commit']}.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    previous = get_cli_value("compare", None)
+    if previous:
+        compare(previous, report)
+
+
+if __name__ == "__main__":
+    main()
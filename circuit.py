@@ -0,0 +1,86 @@
+import json
+import os
+import time
+
+from state import atomic_write_json
+
+
+class CircuitBreakers:
+    """
+    Per-endpoint circuit breakers persisted between runs in a JSON file.
+    After failure_threshold confirmed failures in a row the circuit opens: the endpoint
+    is then only probed every probe_interval seconds with a cheap HEAD request, and
+    its last failures are carried forward in between so the incident stays open.
+    """
+
+    def __init__(self, path, failure_threshold=2, probe_interval=300):
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.circuits = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                self.circuits = json.load(f)
+        except Exception as e:
+            print(f"Error loading circuit state: {e}")
+            return
+        # State written before the full failure list was kept has only the first failure
+        for circuit in self.circuits.values():
+            failure = circuit.pop("last_failure", None)
+            if failure is not None and "last_failures" not in circuit:
+                circuit["last_failures"] = [
+                    [failure["exception"], failure["expected"], failure["received"], failure.get("detail")]
+                ]
+
+    def save(self):
+        try:
+            atomic_write_json(self.path, self.circuits, indent=2)
+        except Exception as e:
+            print(f"Error writing circuit state: {e}")
+
+    def get_open(self, site, endpoint):
+        circuit = self.circuits.get(f"{site}{endpoint}")
+        if circuit and circuit["open"]:
+            return circuit
+        return None
+
+    def probe_due(self, circuit, now=None):
+        now = time.time() if now is None else now
+        return now - circuit["last_probe"] >= self.probe_interval
+
+    def seconds_until_probe(self, circuit, now=None):
+        now = time.time() if now is None else now
+        return max(0, self.probe_interval - (now - circuit["last_probe"]))
+
+    def last_failures(self, circuit):
+        # The (exception, expected, received, detail) failures carried while the circuit is open
+        return [tuple(failure) for failure in circuit.get("last_failures", ())]
+
+    def record_failure(self, site, endpoint, failures):
+        # failures lists (exception, expected, received, detail). Returns True if they opened the circuit
+        now = time.time()
+        circuit = self.circuits.setdefault(f"{site}{endpoint}", {
+            "open": False,
+            "failures": 0,
+            "opened_at": None,
+            "last_probe": now,
+        })
+        circuit["failures"] += 1
+        circuit["last_probe"] = now
+        circuit["last_failures"] = [list(failure) for failure in failures]
+
+        if not circuit["open"] and circuit["failures"] >= self.failure_threshold:
+            circuit["open"] = True
+            circuit["opened_at"] = now
+            return True
+        return False
+
+    def record_success(self, site, endpoint):
+        # Returns True if this success closed an open circuit
+        circuit = self.circuits.pop(f"{site}{endpoint}", None)
+        return bool(circuit and circuit["open"])
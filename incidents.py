@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import time
+
+from state import atomic_write_json, locked
+
+OPEN = "open"
+ACKNOWLEDGED = "acknowledged"
+RESOLVED = "resolved"
+
+
+def fingerprint(alerts):
+    # Identifies a failure by what went wrong, so a repeat of the same failure isn't news,
+    # however many times it was seen
+    parts = sorted({
+        f"{alert.site}|{alert.endpoint}|{alert.exception}|{alert.expected}|{alert.received}"
+        for alert in alerts
+    })
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class IncidentTracker:
+    """
+    Per-endpoint incidents (open -> acknowledged -> resolved) persisted in a JSON file,
+    with a notification batcher that merges new, ongoing and recovered incidents into
+    at most one digest per window.
+
+    - an endpoint's incident becomes notifiable once it has been open for notify_after seconds
+    - a changed failure fingerprint re-notifies the incident, the same failure does not
+    - open, unacknowledged incidents are repeated in a digest every reminder_interval seconds
+    - recoveries are only reported for incidents that were notified in the first place
+
+    Acknowledgements can come from another process (run.py --ack) writing the state file;
+    they are merged in before every update and save, so a long-running daemon or collector
+    doesn't overwrite them.
+    """
+
+    def __init__(self, path, notify_after=300, digest_window=300, reminder_interval=900):
+        self.path = path
+        self.notify_after = notify_after
+        self.digest_window = digest_window
+        self.reminder_interval = reminder_interval
+
+        self.incidents = {}
+        self.recovered = []
+        self.last_digest = 0
+        self.last_reminder = 0
+        self.loaded_mtime_ns = None
+        self.load()
+
+    def read(self):
+        self.loaded_mtime_ns = os.stat(self.path).st_mtime_ns
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            data = self.read()
+            self.incidents = data.get("incidents", {})
+            self.recovered = data.get("recovered", [])
+            self.last_digest = data.get("last_digest", 0)
+            self.last_reminder = data.get("last_reminder", 0)
+        except Exception as e:
+            print(f"Error loading incident state: {e}")
+
+    def to_dict(self):
+        return {
+            "incidents": self.incidents,
+            "recovered": self.recovered,
+            "last_digest": self.last_digest,
+            "last_reminder": self.last_reminder,
+        }
+
+    def save(self):
+        try:
+            with locked(self.path):
+                self.merge_acknowledgements()
+                atomic_write_json(self.path, self.to_dict(), indent=2)
+                self.loaded_mtime_ns = os.stat(self.path).st_mtime_ns
+        except Exception as e:
+            print(f"Error writing incident state: {e}")
+
+    def merge_acknowledgements(self):
+        # Adopts acknowledgements written to the file by another process since it was last read
+        try:
+            if os.stat(self.path).st_mtime_ns == self.loaded_mtime_ns:
+                return
+            incidents = self.read().get("incidents", {})
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Error reading incident state: {e}")
+            return
+        for key, saved in incidents.items():
+            incident = self.incidents.get(key)
+            if (
+                incident is not None
+                and saved.get("state") == ACKNOWLEDGED
+                and incident["state"] == OPEN
+                and saved.get("fingerprint") == incident["fingerprint"]
+            ):
+                incident["state"] = ACKNOWLEDGED
+                print(f"Acknowledgement picked up for {key}")
+
+    def acknowledge_saved(self, key):
+        """
+        Acknowledges an incident with a locked read-modify-write of the state file, safe
+        while a daemon or collector owns the tracker. Returns False if it isn't open.
+        """
+        with locked(self.path):
+            self.load()
+            if not self.acknowledge(key):
+                return False
+            atomic_write_json(self.path, self.to_dict(), indent=2)
+        return True
+
+    def update(self, alerts, checked, now=None, monitored=None):
+        """
+        Applies one scan: alerts is the list of Alert records raised, checked is the set of
+        "site+endpoint" keys that were actually checked (only those can recover).
+        monitored, if given, is every key this process is responsible for; incidents of
+        endpoints outside it (removed, disabled or moved to another shard) are dropped.
+        """
+        now = time.time() if now is None else now
+        self.merge_acknowledgements()
+
+        by_key = {}
+        for alert in alerts:
+            by_key.setdefault(alert.key, []).append(alert)
+
+        for key, endpoint_alerts in by_key.items():
+            first = endpoint_alerts[0]
+            current = fingerprint(endpoint_alerts)
+            incident = self.incidents.get(key)
+
+            if incident is None:
+                incident = self.incidents[key] = {
+                    "site": first.site,
+                    "endpoint": first.endpoint,
+                    "state": OPEN,
+                    "opened_at": now,
+                    "notified": False,
+                    "fingerprint": current,
+                    "failures": 0,
+                }
+                print(f"🆕 Incident opened for {key}")
+            elif incident["fingerprint"] != current:
+                # A different failure on the same endpoint is news again, even if acknowledged
+                incident["fingerprint"] = current
+                incident["state"] = OPEN
+                incident["notified"] = False
+
+            incident["last_seen"] = now
+            incident["failures"] += 1
+            incident["exceptions"] = sorted({alert.exception for alert in endpoint_alerts})
+
+        for key in checked:
+            if key in by_key or key not in self.incidents:
+                continue
+            incident = self.incidents.pop(key)
+            incident["state"] = RESOLVED
+            incident["resolved_at"] = now
+            print(f"✅ Incident resolved for {key}")
+            if incident["notified"]:
+                self.recovered.append(incident)
+
+        if monitored is not None:
+            for key in [key for key in self.incidents if key not in monitored and key not in by_key]:
+                del self.incidents[key]
+                print(f"🗑️ Incident dropped for {key}, it is no longer monitored here")
+
+    def acknowledge(self, key):
+        incident = self.incidents.get(key)
+        if incident is None:
+            return False
+        incident["state"] = ACKNOWLEDGED
+        return True
+
+    def open_incidents(self):
+        return [incident for incident in self.incidents.values() if incident["state"] != RESOLVED]
+
+    def oldest_open_seconds(self, now=None):
+        now = time.time() if now is None else now
+        incidents = self.open_incidents()
+        return max((now - incident["opened_at"] for incident in incidents), default=0)
+
+    def site_summary(self):
+        # Site-level view: the open endpoint incidents of each site and when the site's incident began
+        sites = {}
+        for incident in self.open_incidents():
+            site = sites.setdefault(incident["site"], {"endpoints": [], "opened_at": incident["opened_at"]})
+            site["endpoints"].append(incident["endpoint"])
+            site["opened_at"] = min(site["opened_at"], incident["opened_at"])
+        return sites
+
+    def digest(self, now=None):
+        """
+        Returns {"new": [...], "ongoing": [...], "recovered": [...], "sites": site_summary()}
+        when a notification is due, or None. Returned incidents are marked as notified.
+        """
+        now = time.time() if now is None else now
+        if now - self.last_digest < self.digest_window:
+            return None
+
+        new = [
+            incident for incident in self.incidents.values()
+            if incident["state"] == OPEN and not incident["notified"] and now - incident["opened_at"] >= self.notify_after
+        ]
+        ongoing = [
+            incident for incident in self.incidents.values()
+            if incident["state"] == OPEN and incident["notified"]
+        ]
+        reminder_due = ongoing and now - self.last_reminder >= self.reminder_interval
+
+        if not (new or self.recovered or reminder_due):
+            return None
+
+        for incident in new:
+            incident["notified"] = True
+        digest = {"new": new, "ongoing": ongoing, "recovered": self.recovered, "sites": self.site_summary()}
+
+        self.recovered = []
+        self.last_digest = now
+        # Every open incident in this digest was just mentioned, reminders count from here
+        if new or ongoing:
+            self.last_reminder = now
+        return digest
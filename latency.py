@@ -0,0 +1,108 @@
+import json
+import math
+import os
+import time
+
+from state import atomic_write_json
+
+
+class LatencySketch:
+    """
+    Log-bucketed quantile sketch (DDSketch style) with a bounded relative error.
+    Counts decay exponentially with the given half-life, so quantiles follow recent traffic.
+    """
+
+    __slots__ = ("gamma", "log_gamma", "buckets", "count", "updated")
+
+    def __init__(self, relative_accuracy=0.02):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.count = 0.0
+        self.updated = None
+
+    def decay(self, now, half_life):
+        if self.updated is not None and half_life > 0 and now > self.updated:
+            factor = 0.5 ** ((now - self.updated) / half_life)
+            self.buckets = {key: value * factor for key, value in self.buckets.items() if value * factor >= 0.01}
+            self.count = sum(self.buckets.values())
+        self.updated = now
+
+    def add(self, value, now=None, half_life=3600):
+        self.decay(time.time() if now is None else now, half_life)
+        key = math.ceil(math.log(max(value, 1e-3)) / self.log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0.0) + 1
+        self.count += 1
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                # Midpoint of the bucket keeps the error within the relative accuracy
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {
+            "gamma": self.gamma,
+            "updated": self.updated,
+            "buckets": {str(key): round(value, 4) for key, value in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        sketch.gamma = data["gamma"]
+        sketch.log_gamma = math.log(sketch.gamma)
+        sketch.updated = data.get("updated")
+        sketch.buckets = {int(key): value for key, value in data.get("buckets", {}).items()}
+        sketch.count = sum(sketch.buckets.values())
+        return sketch
+
+
+class LatencyTracker:
+    """
+    Rolling p50/p95/p99 latency per site/endpoint, persisted between runs in a JSON file.
+    """
+
+    def __init__(self, path, half_life=3600):
+        self.path = path
+        self.half_life = half_life
+        self.sketches = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.sketches = {key: LatencySketch.from_dict(value) for key, value in data.items()}
+        except Exception as e:
+            print(f"Error loading latency state: {e}")
+
+    def save(self):
+        try:
+            atomic_write_json(self.path, {key: sketch.to_dict() for key, sketch in self.sketches.items()})
+        except Exception as e:
+            print(f"Error writing latency state: {e}")
+
+    def observe(self, site, endpoint, latency_ms):
+        """
+        Adds a latency sample and returns the rolling percentiles and sample count for the endpoint.
+        """
+        key = f"{site}{endpoint}"
+        sketch = self.sketches.get(key)
+        if sketch is None:
+            sketch = self.sketches[key] = LatencySketch()
+        sketch.add(latency_ms, half_life=self.half_life)
+        return {
+            "p50": sketch.quantile(0.5),
+            "p95": sketch.quantile(0.95),
+            "p99": sketch.quantile(0.99),
+            "samples": sketch.count,
+        }
@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """
+    In-process histograms and counters rendered in OpenMetrics text format.
+    Series are keyed by metric name and a sorted tuple of label pairs.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def snapshot(self):
+        # Picklable copy of every series, used to ship metrics out of worker processes
+        with self.lock:
+            return {"histograms": self.histograms, "counters": self.counters}
+
+    def merge(self, snapshot):
+        with self.lock:
+            for name, series in snapshot["histograms"].items():
+                target = self.histograms.setdefault(name, {})
+                for key, histogram in series.items():
+                    existing = target.get(key)
+                    if existing is None:
+                        target[key] = histogram
+                        continue
+                    existing.counts = [a + b for a, b in zip(existing.counts, histogram.counts)]
+                    existing.sum += histogram.sum
+                    existing.count += histogram.count
+
+            for name, series in snapshot["counters"].items():
+                target = self.counters.setdefault(name, {})
+                for key, value in series.items():
+                    target[key] = target.get(key, 0) + value
+
+    @contextmanager
+    def time_phase(self, phase):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe("monitor_phase_duration_seconds", time.monotonic() - started, phase=phase)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, series in self.histograms.items():
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(labels, ('le', bound))} {cumulative}")
+                    lines.append(f"{name}_bucket{format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+            for name, series in self.counters.items():
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}_total{format_labels(labels)} {value}")
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        # Write to a temp file first so a scraper never reads a half-written file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+        thread.start()
+        print(f"📈 Serving metrics on http://{host}:{port}/metrics")
+        return server
+
+
+def create_trace_config(registry):
+    """
+    aiohttp trace hooks recording DNS, connect (TCP and TLS together, aiohttp does not
+    separate them) and time to first byte. Labels come from the trace_request_ctx
+    dict passed to session.get().
+    """
+    trace_config = aiohttp.TraceConfig()
+
+    def labels(ctx):
+        return ctx.trace_request_ctx or {}
+
+    async def on_request_start(session, ctx, params):
+        ctx.request_start = time.monotonic()
+
+    async def on_dns_resolvehost_start(session, ctx, params):
+        ctx.dns_start = time.monotonic()
+
+    async def on_dns_resolvehost_end(session, ctx, params):
+        registry.observe("monitor_http_dns_seconds", time.monotonic() - ctx.dns_start, **labels(ctx))
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_start = time.monotonic()
+
+    async def on_connection_create_end(session, ctx, params):
+        registry.observe("monitor_http_connect_seconds", time.monotonic() - ctx.connect_start, **labels(ctx))
+
+    async def on_request_end(session, ctx, params):
+        # Fires once the response headers have arrived
+        registry.observe("monitor_http_ttfb_seconds", time.monotonic() - ctx.request_start, **labels(ctx))
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
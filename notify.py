@@ -0,0 +1,265 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+
+import aiohttp
+
+from state import InstanceLock
+
+
+class PermanentDeliveryError(Exception):
+    # The sink rejected the notification, retrying won't help
+    pass
+
+
+class RetryableDeliveryError(Exception):
+    pass
+
+
+class MailgunSink:
+    name = "mailgun"
+
+    def __init__(self, domain, private_key, sender):
+        self.url = f"https://api.mailgun.net/v3/{domain}/messages"
+        self.auth = aiohttp.BasicAuth("api", private_key)
+        self.sender = sender
+
+    async def send(self, session, notification, timeout):
+        form = aiohttp.FormData()
+        form.add_field("from", self.sender)
+        for address in notification["to"]:
+            form.add_field("to", address)
+        form.add_field("subject", notification["subject"])
+        form.add_field("html", notification["html"])
+
+        # File objects are streamed by aiohttp instead of being read into memory
+        files = []
+        try:
+            for kind, name, path in notification["attachments"]:
+                f = open(path, "rb")
+                files.append(f)
+                form.add_field(kind, f, filename=name)
+
+            async with session.post(self.url, data=form, auth=self.auth, timeout=timeout) as response:
+                text = await response.text()
+                print(f"mailgun responded {response.status}: {text[:200]}")
+                raise_for_delivery_status(response.status)
+        finally:
+            for f in files:
+                f.close()
+
+
+class WebhookSink:
+    name = "webhook"
+
+    def __init__(self, url):
+        self.url = url
+
+    async def send(self, session, notification, timeout):
+        payload = {
+            "id": notification["id"],
+            "subject": notification["subject"],
+            "to": notification["to"],
+            "html": notification["html"],
+            "attachments": [name for _, name, _ in notification["attachments"]],
+        }
+        async with session.post(self.url, json=payload, timeout=timeout) as response:
+            raise_for_delivery_status(response.status)
+
+
+class FileSink:
+    """
+    Local stand-in for tests and dry runs: writes each notification and its
+    attachments into a directory instead of sending them anywhere.
+    """
+
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+
+    async def send(self, session, notification, timeout):
+        target = os.path.join(self.path, notification["id"])
+        os.makedirs(target, exist_ok=True)
+        with open(os.path.join(target, "message.html"), "w", encoding="utf-8") as f:
+            f.write(notification["html"])
+        with open(os.path.join(target, "message.json"), "w") as f:
+            json.dump({key: value for key, value in notification.items() if key != "html"}, f, indent=2)
+        for _, name, path in notification["attachments"]:
+            shutil.copyfile(path, os.path.join(target, name))
+
+
+def raise_for_delivery_status(status):
+    if status == 429 or status >= 500:
+        raise RetryableDeliveryError(f"temporary failure with status {status}")
+    if status >= 400:
+        raise PermanentDeliveryError(f"rejected with status {status}")
+
+
+class NotificationDispatcher:
+    """
+    Disk-backed outbox delivered asynchronously to pluggable sinks.
+    enqueue() only writes the notification (and hard links to its attachments) into the
+    outbox directory, so it survives a crash. deliver_pending() sends everything in the
+    outbox over one pooled session, with a timeout and jittered retries per sink.
+    One process delivers at a time, guarded by an flock in the outbox.
+    """
+
+    def __init__(self, outbox_dir, sinks, timeout=10, retries=3, backoff=1.0, max_attempts=20):
+        self.outbox_dir = outbox_dir
+        self.sinks = sinks
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+        self.wakeup = None
+        os.makedirs(os.path.join(outbox_dir, "failed"), exist_ok=True)
+
+    def enqueue(self, subject, html, to, attachments=()):
+        notification_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        directory = os.path.join(self.outbox_dir, notification_id)
+        os.makedirs(directory)
+
+        # Link attachments into the outbox so cleanup of the originals doesn't lose them
+        stored = []
+        for kind, name, path in attachments:
+            target = os.path.join(directory, name)
+            try:
+                os.link(path, target)
+            except OSError:
+                try:
+                    shutil.copyfile(path, target)
+                except OSError as e:
+                    print(f"Error adding attachment {path}: {e}")
+                    continue
+            stored.append((kind, name, target))
+
+        notification = {
+            "id": notification_id,
+            "subject": subject,
+            "html": html,
+            "to": list(to),
+            "attachments": stored,
+            "attempts": 0,
+            "delivered": [],
+        }
+        self.write(notification)
+        print(f"📬 Queued notification {notification_id} for {', '.join(sink.name for sink in self.sinks)}")
+
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return notification_id
+
+    def write(self, notification):
+        path = os.path.join(self.outbox_dir, notification["id"], "notification.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(notification, f)
+        os.replace(f"{path}.tmp", path)
+
+    def pending(self):
+        for entry in sorted(os.listdir(self.outbox_dir)):
+            path = os.path.join(self.outbox_dir, entry, "notification.json")
+            if entry == "failed" or not os.path.exists(path):
+                continue
+            try:
+                with open(path, "r") as f:
+                    yield json.load(f)
+            except Exception as e:
+                print(f"Error reading outbox entry {entry}: {e}")
+
+    async def send_with_retry(self, session, sink, notification):
+        for attempt in range(self.retries + 1):
+            try:
+                await sink.send(session, notification, self.timeout)
+                return True
+            except PermanentDeliveryError as e:
+                print(f"❌ {sink.name} rejected notification {notification['id']}: {e}")
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"❌ {sink.name} delivery of {notification['id']} failed: {e or type(e).__name__}")
+                    return False
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"🔁 {sink.name} delivery failed ({e or type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def deliver(self, session, notification):
+        # Progress is written as it happens, a delivery cut off by the deadline resumes from there
+        notification["attempts"] += 1
+        self.write(notification)
+        permanent_failure = False
+        for sink in self.sinks:
+            if sink.name in notification["delivered"]:
+                continue
+            try:
+                if await self.send_with_retry(session, sink, notification):
+                    notification["delivered"].append(sink.name)
+                    self.write(notification)
+            except PermanentDeliveryError:
+                permanent_failure = True
+
+        directory = os.path.join(self.outbox_dir, notification["id"])
+        if all(sink.name in notification["delivered"] for sink in self.sinks):
+            shutil.rmtree(directory, ignore_errors=True)
+            print(f"📨 Delivered notification {notification['id']}")
+        elif permanent_failure or notification["attempts"] >= self.max_attempts:
+            self.write(notification)
+            shutil.move(directory, os.path.join(self.outbox_dir, "failed", notification["id"]))
+            print(f"⚠️ Gave up on notification {notification['id']}, moved to the failed outbox")
+        else:
+            self.write(notification)
+
+    async def deliver_pending(self, session=None, deadline=None):
+        """
+        Delivers everything in the outbox. deadline caps the whole pass in seconds, whatever
+        is left stays in the outbox for the next pass. Returns the number of notifications
+        attempted, 0 if another process is already delivering.
+        """
+        if session is None:
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=4)) as session:
+                return await self.deliver_pending(session, deadline)
+
+        lock = InstanceLock(os.path.join(self.outbox_dir, ".deliver.lock"))
+        if not lock.acquire():
+            print("Another process is delivering the outbox, leaving it to that one")
+            return 0
+
+        attempted = 0
+        ends = time.monotonic() + deadline if deadline else None
+        try:
+            pending = list(self.pending())
+            for notification in pending:
+                remaining = ends - time.monotonic() if ends else None
+                if remaining is not None and remaining <= 0:
+                    break
+                attempted += 1
+                try:
+                    await asyncio.wait_for(self.deliver(session, notification), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if attempted < len(pending) or (ends and time.monotonic() >= ends):
+                print(f"⏳ Delivery deadline of {deadline:.0f}s reached, the rest of the outbox is left for the next run")
+        finally:
+            lock.release()
+        return attempted
+
+    async def run(self, interval=30, metrics=None):
+        # Background delivery loop for daemon mode, woken early by enqueue()
+        self.wakeup = asyncio.Event()
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=4)) as session:
+            while True:
+                started = time.monotonic()
+                try:
+                    if await self.deliver_pending(session) and metrics:
+                        metrics.observe("monitor_phase_duration_seconds", time.monotonic() - started, phase="email_send")
+                except Exception as e:
+                    print(f"Error delivering notifications: {e}")
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
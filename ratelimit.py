@@ -0,0 +1,109 @@
+import asyncio
+import time
+import zlib
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average with bursts of up to burst requests.
+    reserve() takes a token right away and returns how long the caller must wait before
+    using it, so waiting callers are served in order without polling.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class HostLimiter:
+    # Concurrency cap and optional token bucket for one origin
+    def __init__(self, concurrency, rate=None, burst=1):
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.bucket = TokenBucket(rate, burst) if rate else None
+
+    async def acquire(self):
+        await self.semaphore.acquire()
+        if self.bucket:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                try:
+                    await asyncio.sleep(delay)
+                except BaseException:
+                    self.semaphore.release()
+                    raise
+
+    def release(self):
+        self.semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+class HostLimits:
+    """
+    Per-origin limiters for one event loop. Origins without limits in sites.json get
+    the default concurrency and rate from config.ini. Limiters are keyed by origin and
+    limits, so changed limits in a reloaded sites.json get a limiter of their own.
+    """
+
+    def __init__(self, default_concurrency=10, default_rate=None, default_burst=1):
+        self.default = (default_concurrency, default_rate, default_burst)
+        self.limiters = {}
+
+    def key(self, origin, limits=None):
+        concurrency, rate, burst = limits or self.default
+        return (
+            origin,
+            concurrency if concurrency is not None else self.default[0],
+            rate if rate is not None else self.default[1],
+            burst if burst is not None else self.default[2],
+        )
+
+    def get(self, origin, limits=None):
+        key = self.key(origin, limits)
+        limiter = self.limiters.get(key)
+        if limiter is None:
+            limiter = self.limiters[key] = HostLimiter(*key[1:])
+        return limiter
+
+    def prune(self, in_use):
+        """
+        Drops the limiters of (origin, limits) pairs that are no longer in in_use, e.g. after
+        sites.json was reloaded. Unchanged limits keep their limiter and its state.
+        """
+        keep = {self.key(origin, limits) for origin, limits in in_use}
+        self.limiters = {key: limiter for key, limiter in self.limiters.items() if key in keep}
+
+
+def spread_offsets(endpoint_configs, window):
+    """
+    Start offsets (seconds from the start of the scan) that spread each origin's checks
+    evenly across window, each origin with its own phase so hosts don't start in lockstep.
+    Returns {(site, path): offset}.
+    """
+    by_origin = {}
+    for endpoint_config in endpoint_configs:
+        by_origin.setdefault(endpoint_config.origin, []).append(endpoint_config)
+
+    offsets = {}
+    for origin, endpoints in by_origin.items():
+        slot = window / len(endpoints)
+        phase = (zlib.crc32(origin.encode("utf-8")) % 1000) / 1000 * slot
+        for i, endpoint_config in enumerate(endpoints):
+            offsets[(endpoint_config.site, endpoint_config.path)] = phase + i * slot
+    return offsets
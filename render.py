@@ -0,0 +1,122 @@
+import re
+from html import escape
+
+PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+
+
+class CompiledTemplate:
+    """
+    Template split once at its {{name}} placeholders, so rendering is a single join
+    instead of one str.replace pass over the whole document per placeholder.
+    """
+
+    def __init__(self, text):
+        self.parts = []
+        self.names = []
+        position = 0
+        for match in PLACEHOLDER.finditer(text):
+            self.parts.append(text[position:match.start()])
+            self.names.append(match.group(1))
+            position = match.end()
+        self.tail = text[position:]
+
+    def render(self, **values):
+        out = []
+        for part, name in zip(self.parts, self.names):
+            out.append(part)
+            out.append(str(values.get(name, "")))
+        out.append(self.tail)
+        return "".join(out)
+
+
+def truncate(text, limit):
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"… ({len(text) - limit} more characters)"
+
+
+def render_alerts(
+    alerts,
+    get_num_of_checks,
+    show_headers=False,
+    screenshots_enabled=False,
+    max_body_chars=1000,
+    max_headers=20,
+    referenced=None,
+):
+    """
+    Renders alerts grouped by site. Within a site, alerts with the same exception,
+    response code and assertion detail are collapsed into one entry listing every
+    affected endpoint.
+    Every dynamic value is HTML-escaped, bodies and header lists are capped, and the
+    nonces whose screenshots are referenced are added to the referenced set if given.
+    """
+    grouped = {}
+    for alert in alerts:
+        failures = grouped.setdefault(alert.site, {})
+        failures.setdefault((alert.exception, alert.received, alert.detail), []).append(alert)
+
+    out = []
+    for site, failures in grouped.items():
+        failed_checks = len({alert.endpoint for group in failures.values() for alert in group})
+        out.append(
+            f"<span style='color: #dc818f;'>{failed_checks} of {get_num_of_checks(site)} checks failed for {escape(site)}</span><br>"
+        )
+
+        for (exception, received, detail), group in failures.items():
+            first = group[0]
+            if len(group) == 1:
+                out.append(f"<strong>Endpoint:</strong> {escape(first.endpoint)} <br>")
+            else:
+                out.append(f"<strong>Endpoints ({len(group)}):</strong><br>")
+                for alert in group:
+                    line = f"- {escape(alert.endpoint)} (nonce {alert.nonce})"
+                    if alert.latency_ms is not None:
+                        line += f", {alert.latency_ms:.0f} ms"
+                    out.append(line + "<br>")
+            out.append(f"<strong>Response Code:</strong> {escape(str(received))} <br>")
+
+            if exception:
+                out.append(f"<strong>Exception:</strong> {escape(str(exception))} <br>")
+
+            if detail:
+                out.append(f"<strong>Found:</strong> {escape(truncate(detail, max_body_chars))} <br>")
+
+            if len(group) == 1 and first.latency_ms is not None:
+                percentiles = first.percentiles
+                out.append(
+                    f"<strong>Latency:</strong> {first.latency_ms:.0f} ms "
+                    f"(limit {first.expected} ms, p50 {percentiles['p50']:.0f} / "
+                    f"p95 {percentiles['p95']:.0f} / p99 {percentiles['p99']:.0f} ms) <br>"
+                )
+
+            if first.vantages:
+                out.append(f"<strong>Failing from:</strong> {escape(', '.join(first.vantages))} <br>")
+
+            # Debug nonce
+            out.append(f"<strong>Nonce:</strong> {first.nonce} <br>")
+
+            if first.circuit_open:
+                out.append("<strong>Circuit:</strong> open, endpoint is only being probed periodically <br>")
+            elif screenshots_enabled:
+                # One screenshot per group, identical failures look the same
+                out.append(f"<strong>Screenshot:</strong><br><img src='cid:{first.nonce}.png' alt='Nonce Image'><br>")
+            if referenced is not None and not first.circuit_open:
+                referenced.add(first.nonce)
+
+            if show_headers:
+                if first.headers:
+                    out.append("<strong>Headers:</strong><br>")
+                    for key, value in first.headers[:max_headers]:
+                        out.append(f"- <strong><i>{escape(key)}:</i></strong> {escape(value)} <br>")
+                    if len(first.headers) > max_headers:
+                        out.append(f"- … {len(first.headers) - max_headers} more header(s) <br>")
+
+                if first.excerpt:
+                    out.append(f"<strong>Body:</strong> {escape(truncate(first.excerpt, max_body_chars))} <br>")
+            out.append("<br>")
+        # Optionally, add a separator for each site's alerts
+        out.append("<hr><br>")
+
+    return "".join(out)
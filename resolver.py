@@ -0,0 +1,64 @@
+import asyncio
+import socket
+import time
+
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+
+
+class DNSResolutionError(OSError):
+    pass
+
+
+class CachingResolver(AbstractResolver):
+    """
+    aiohttp resolver that caches lookups for ttl seconds and failed lookups for
+    negative_ttl seconds, shared by every session and TLS probe in a run, so all endpoints
+    of a site resolve their host once. Concurrent lookups of the same host share one query.
+    getaddrinfo doesn't expose record TTLs, so ttl is fixed by config.
+    """
+
+    def __init__(self, ttl=300, negative_ttl=30):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = {}
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        # Created on first use, the default resolver binds to the running event loop
+        self.resolver = None
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        key = (host, port, family)
+        entry = self.cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            hosts, error = entry[1], entry[2]
+            if error:
+                raise DNSResolutionError(error)
+            return hosts
+
+        future = self.pending.get(key)
+        if future is None:
+            self.misses += 1
+            future = self.pending[key] = asyncio.ensure_future(self.lookup(key))
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def lookup(self, key):
+        host, port, family = key
+        if self.resolver is None:
+            self.resolver = DefaultResolver()
+        try:
+            hosts = await self.resolver.resolve(host, port, family)
+        except OSError as e:
+            error = f"DNS resolution failed for {host}: {e.strerror or e}"
+            self.cache[key] = (time.monotonic() + self.negative_ttl, None, error)
+            raise DNSResolutionError(error)
+        self.cache[key] = (time.monotonic() + self.ttl, hosts, None)
+        return hosts
+
+    async def close(self):
+        if self.resolver is not None:
+            await self.resolver.close()
+            self.resolver = None
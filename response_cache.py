@@ -0,0 +1,79 @@
+import json
+import os
+from collections import OrderedDict
+
+from state import atomic_write_json
+
+
+class ResponseCache:
+    """
+    Per-endpoint validators (ETag, Last-Modified) and content hash of the last response,
+    together with its status and failed assertions, persisted in a JSON file.
+    Bounded to max_entries, the least recently used endpoint is evicted first.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                self.entries = OrderedDict(json.load(f))
+        except Exception as e:
+            print(f"Error loading response cache: {e}")
+
+    def save(self):
+        try:
+            atomic_write_json(self.path, list(self.entries.items()))
+        except Exception as e:
+            print(f"Error writing response cache: {e}")
+
+    def get(self, site, endpoint, assertions_key):
+        # A verdict is only valid for the assertions it was computed with
+        key = f"{site}{endpoint}"
+        entry = self.entries.get(key)
+        if entry is None or entry.get("assertions") != assertions_key:
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, site, endpoint, assertions_key, status, failures, etag=None, last_modified=None, digest=None):
+        key = f"{site}{endpoint}"
+        if not (etag or last_modified or digest):
+            # Nothing to validate against next time
+            self.entries.pop(key, None)
+            return
+        self.entries[key] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "hash": digest,
+            "status": status,
+            "assertions": assertions_key,
+            "failures": failures,
+        }
+        self.entries.move_to_end(key)
+        self.evict()
+
+    def update(self, entries):
+        # Merges entries checked elsewhere, e.g. by a worker process
+        for key, entry in entries.items():
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
@@ -0,0 +1,151 @@
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    ts REAL NOT NULL,
+    site TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    latency_ms REAL,
+    ok INTEGER NOT NULL,
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS checks_site_ts ON checks (site, ts);
+CREATE INDEX IF NOT EXISTS checks_ts ON checks (ts);
+
+CREATE TABLE IF NOT EXISTS checks_hourly (
+    hour INTEGER NOT NULL,
+    site TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    checks INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    latency_sum_ms REAL NOT NULL,
+    latency_max_ms REAL NOT NULL,
+    PRIMARY KEY (site, endpoint, hour)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class ResultsStore:
+    """
+    Append-only history of every check, kept in SQLite in WAL mode.
+    Results are buffered in memory and written in one transaction per scan by flush().
+    Raw rows older than the retention period are rolled up into hourly rows and deleted.
+    """
+
+    def __init__(self, path, retention_days=30):
+        self.path = path
+        self.retention_days = retention_days
+        self.pending = []
+        self.last_batch_start = None
+
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def record(self, site, endpoint, status, latency_ms, reason=None, ts=None):
+        self.pending.append((
+            time.time() if ts is None else ts,
+            site,
+            endpoint,
+            int(status),
+            latency_ms,
+            0 if reason else 1,
+            reason,
+        ))
+
+    def flush(self):
+        if not self.pending:
+            return 0
+        rows, self.pending = self.pending, []
+        self.last_batch_start = min(row[0] for row in rows)
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO checks (ts, site, endpoint, status, latency_ms, ok, reason) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def query(self, site=None, start=None, end=None, failures_only=False):
+        # Raw results by site and time range, oldest first
+        sql = "SELECT ts, site, endpoint, status, latency_ms, ok, reason FROM checks WHERE ts >= ? AND ts < ?"
+        params = [start or 0, end or time.time() + 1]
+        if site is not None:
+            sql += " AND site = ?"
+            params.append(site)
+        if failures_only:
+            sql += " AND ok = 0"
+        sql += " ORDER BY ts"
+        return self.db.execute(sql, params).fetchall()
+
+    def count_failures(self, since, site=None):
+        sql = "SELECT COUNT(*) FROM checks WHERE ts >= ? AND ok = 0"
+        params = [since]
+        if site is not None:
+            sql += " AND site = ?"
+            params.append(site)
+        return self.db.execute(sql, params).fetchone()[0]
+
+    def availability(self, site, start, end=None):
+        """
+        Returns (checks, failures) for a site over a time range, combining raw rows
+        with hourly rollups so SLA reports can reach past the retention period.
+        """
+        end = end or time.time()
+        raw = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(1 - ok), 0) FROM checks WHERE site = ? AND ts >= ? AND ts < ?",
+            (site, start, end),
+        ).fetchone()
+        rolled = self.db.execute(
+            "SELECT COALESCE(SUM(checks), 0), COALESCE(SUM(failures), 0) FROM checks_hourly WHERE site = ? AND hour >= ? AND hour < ?",
+            (site, int(start // 3600), int(end // 3600) + 1),
+        ).fetchone()
+        return raw[0] + rolled[0], raw[1] + rolled[1]
+
+    def maybe_rollup(self, interval=3600):
+        # Rollup is cheap to skip, so every run can call this and only one per interval does the work
+        now = time.time()
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'last_rollup'").fetchone()
+        if row and now - float(row[0]) < interval:
+            return 0
+        return self.rollup(now)
+
+    def rollup(self, now=None):
+        now = time.time() if now is None else now
+        # Only roll up whole hours so a rolled hour is never written twice
+        cutoff = (now - self.retention_days * 86400) // 3600 * 3600
+        with self.db:
+            self.db.execute(
+                """
+                INSERT INTO checks_hourly (hour, site, endpoint, checks, failures, latency_sum_ms, latency_max_ms)
+                SELECT CAST(ts / 3600 AS INTEGER), site, endpoint, COUNT(*), SUM(1 - ok),
+                       COALESCE(SUM(latency_ms), 0), COALESCE(MAX(latency_ms), 0)
+                FROM checks WHERE ts < ?
+                GROUP BY CAST(ts / 3600 AS INTEGER), site, endpoint
+                ON CONFLICT (site, endpoint, hour) DO UPDATE SET
+                    checks = checks + excluded.checks,
+                    failures = failures + excluded.failures,
+                    latency_sum_ms = latency_sum_ms + excluded.latency_sum_ms,
+                    latency_max_ms = MAX(latency_max_ms, excluded.latency_max_ms)
+                """,
+                (cutoff,),
+            )
+            deleted = self.db.execute("DELETE FROM checks WHERE ts < ?", (cutoff,)).rowcount
+            self.db.execute(
+                "INSERT INTO meta (key, value) VALUES ('last_rollup', ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (str(now),),
+            )
+        if deleted:
+            print(f"🗜️ Rolled up {deleted} check result(s) older than {self.retention_days} days")
+        return deleted
+
+    def close(self):
+        self.flush()
+        self.db.close()
@@ -1,62 +1,254 @@
 #!/usr/bin/env python3
+import time
+
+# Taken before the other imports so --profile-startup can report how long they take
+STARTUP_STARTED = time.perf_counter()
+
 import json
-import requests
 import configparser
 import os
-import time
 import uuid
+import random
 import asyncio
 import aiohttp
 import sys
-from multidict import CIMultiDictProxy
-from selenium import webdriver
+import zlib
+import hashlib
+import codecs
+import socket
 from datetime import datetime, timezone
+from html import escape
+from scheduler import EndpointScheduler
+from screenshots import ScreenshotPool
+from results_store import ResultsStore
+from metrics import MetricsRegistry, create_trace_config
+from latency import LatencyTracker
+from circuit import CircuitBreakers
+from response_cache import ResponseCache
+from sites_model import load_sites_config
+from incidents import IncidentTracker
+from notify import NotificationDispatcher, MailgunSink, WebhookSink, FileSink
+from render import CompiledTemplate, render_alerts
+from alerts import Alert, compact_headers
+from artifacts import ArtifactSpool
+from state import InstanceLock, StateFile
+from ratelimit import HostLimits, spread_offsets
+from resolver import CachingResolver, DNSResolutionError
+from tls_probe import TLSMonitor
+
+# Selenium, multiprocessing and the vantage/collector code are only imported once a failure,
+# sharded scan, vantage point or collector needs them
+IMPORTS_DONE = time.perf_counter()
 
 scriptdir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(scriptdir)
 
 ALERTS = []
 PARSER = configparser.ConfigParser()
-BROWSER = None
+SCREENSHOTS_ENABLED = False
+SCREENSHOT_POOL = None
+RESULTS_STORE = None
+LATENCY_TRACKER = None
+CIRCUITS = None
+RESPONSE_CACHE = None
+ARTIFACTS = None
+TRACKING = None
+SITES_CONFIG = None
+DEFERRED_SCREENSHOTS = None
+INCIDENTS = None
+NOTIFIER = None
+EMAIL_TEMPLATE = None
+HOST_LIMITS = None
+RESOLVER = None
+TLS_MONITOR = None
+CHECKED_ENDPOINTS = set()
+
+# Endpoint label of certificate alerts, which belong to an origin rather than a path
+TLS_ENDPOINT = "[TLS]"
+
+METRICS = MetricsRegistry()
+METRICS.describe("monitor_check_duration_seconds", "Total time of an endpoint check including the body read")
+METRICS.describe("monitor_http_dns_seconds", "DNS resolution time")
+METRICS.describe("monitor_http_connect_seconds", "TCP connect and TLS handshake time")
+METRICS.describe("monitor_http_ttfb_seconds", "Time from request start to response headers")
+METRICS.describe("monitor_phase_duration_seconds", "Duration of each phase of a run")
+METRICS.describe("monitor_check_results", "Check results by outcome")
+METRICS.describe("monitor_response_cache", "Revalidated checks by outcome (not_modified, same_hash, changed)")
+METRICS.describe("monitor_vantage_results", "Results received from each vantage point (collector mode)")
+METRICS.describe("monitor_tls_handshake_seconds", "TLS handshake time of each HTTPS origin, probed once per origin")
 SCREENSHOTS = []
 SHOW_HEADERS = "--show-headers" in sys.argv
 TAKE_SCREENSHOT = "--take-screenshot" in sys.argv
+CONCURRENT_SCAN = "--concurrent" in sys.argv
+DAEMON_MODE = "--daemon" in sys.argv
+COLLECTOR_MODE = "--collector" in sys.argv
+# Set from VANTAGE_COLLECTOR_URL once config.ini is read
+VANTAGE_MODE = False
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 PythonMonitorScript/1.0"
 
 def now_iso():
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
-def load_tracking():
-    path = os.path.join(scriptdir, "tracking.json")
-    if not os.path.exists(path):
-        return {
-            "incident_active": False,
-            "incident_start": None,
-            "incident_last_seen": None,
-            "incident_duration": "0s",
-            "failures_total": 0,
-        }
+def get_tracking():
+    # tracking.json is read once per run, changes are written back once by save_state()
+    global TRACKING
+    if TRACKING is None:
+        TRACKING = StateFile(
+            os.path.join(scriptdir, "tracking.json"),
+            default={
+                "incident_active": False,
+                "incident_start": None,
+                "incident_last_seen": None,
+                "incident_duration": "0s",
+                "failures_total": 0,
+            },
+        )
+    return TRACKING
 
-    try:
-        with open(path, "r") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading tracking file: {e}")
-        return {}
+
+def load_tracking():
+    return get_tracking().data
 
 
 def save_tracking(data: dict):
-    path = os.path.join(scriptdir, "tracking.json")
+    get_tracking().replace(data)
+
+
+def save_state():
+    """
+    Writes every piece of state changed by this run, each file once and atomically.
+    """
+    if LATENCY_TRACKER:
+        LATENCY_TRACKER.save()
+    if CIRCUITS:
+        CIRCUITS.save()
+    if RESPONSE_CACHE:
+        RESPONSE_CACHE.save()
+    if TLS_MONITOR:
+        TLS_MONITOR.save()
+    if INCIDENTS:
+        INCIDENTS.save()
+    get_tracking().save()
+
+
+def record_result(site, endpoint, status, latency_ms, reason=None, outcome=None):
+    # outcome overrides the pass/fail label, e.g. "circuit_open" for checks skipped while down
+    if latency_ms is not None:
+        METRICS.observe("monitor_check_duration_seconds", latency_ms / 1000, site=site, endpoint=endpoint)
+    METRICS.inc("monitor_check_results", site=site, result=outcome or ("fail" if reason else "pass"))
+
+    # Buffered in the results store and written once per scan
+    if RESULTS_STORE:
+        RESULTS_STORE.record(site, endpoint, status, latency_ms, reason)
+
+
+def open_results_store():
+    path = PARSER.get("DEFAULT", "RESULTS_DB", fallback="results.db")
+    if not path:
+        return None
     try:
-        with open(path, "w") as f:
-            json.dump(data, f, indent=2)
+        return ResultsStore(
+            os.path.join(scriptdir, path),
+            retention_days=PARSER.getint("DEFAULT", "RESULTS_RETENTION_DAYS", fallback=30),
+        )
     except Exception as e:
-        print(f"Error writing tracking file: {e}")
+        print(f"Error opening results store: {e}")
+        return None
+
+
+def open_latency_tracker():
+    return LatencyTracker(
+        os.path.join(scriptdir, PARSER.get("DEFAULT", "LATENCY_STATE_FILE", fallback="latency.json")),
+        half_life=PARSER.getfloat("DEFAULT", "LATENCY_HALF_LIFE_MINUTES", fallback=60) * 60,
+    )
+
+
+def open_circuit_breakers():
+    path = PARSER.get("DEFAULT", "CIRCUIT_STATE_FILE", fallback="circuits.json")
+    if not path:
+        return None
+    return CircuitBreakers(
+        os.path.join(scriptdir, path),
+        failure_threshold=PARSER.getint("DEFAULT", "CIRCUIT_FAILURE_THRESHOLD", fallback=2),
+        probe_interval=PARSER.getfloat("DEFAULT", "CIRCUIT_PROBE_INTERVAL", fallback=300),
+    )
+
+
+def open_response_cache():
+    path = PARSER.get("DEFAULT", "RESPONSE_CACHE_FILE", fallback="response_cache.json")
+    if not path:
+        return None
+    return ResponseCache(
+        os.path.join(scriptdir, path),
+        max_entries=PARSER.getint("DEFAULT", "RESPONSE_CACHE_MAX_ENTRIES", fallback=10000),
+    )
+
+
+def open_tls_monitor():
+    path = PARSER.get("DEFAULT", "TLS_STATE_FILE", fallback="tls_state.json")
+    if not path:
+        return None
+    return TLSMonitor(
+        os.path.join(scriptdir, path),
+        probe_interval=PARSER.getfloat("DEFAULT", "TLS_PROBE_INTERVAL", fallback=3600),
+        warn_days=PARSER.getint("DEFAULT", "TLS_EXPIRY_WARN_DAYS", fallback=14),
+        timeout=PARSER.getfloat("DEFAULT", "TLS_HANDSHAKE_TIMEOUT", fallback=10),
+    )
+
+
+def open_artifact_spool():
+    return ArtifactSpool(
+        os.path.join(scriptdir, PARSER.get("DEFAULT", "ARTIFACT_DIR", fallback="artifacts") or "artifacts"),
+        max_bytes=PARSER.getfloat("DEFAULT", "ARTIFACT_MAX_MB", fallback=200) * 1024 * 1024,
+    )
+
+
+def open_incident_tracker():
+    path = PARSER.get("DEFAULT", "INCIDENT_STATE_FILE", fallback="incidents.json") or "incidents.json"
+    return IncidentTracker(
+        os.path.join(scriptdir, path),
+        notify_after=PARSER.getfloat("DEFAULT", "INCIDENT_NOTIFY_AFTER_MINUTES", fallback=5) * 60,
+        digest_window=PARSER.getfloat("DEFAULT", "DIGEST_WINDOW_MINUTES", fallback=5) * 60,
+        reminder_interval=PARSER.getfloat("DEFAULT", "REMINDER_INTERVAL_MINUTES", fallback=15) * 60,
+    )
+
+
+def create_notifier():
+    """
+    Builds the notification dispatcher from NOTIFY_SINKS, a comma separated list of
+    mailgun, webhook and file.
+    """
+    sinks = []
+    for name in PARSER.get("DEFAULT", "NOTIFY_SINKS", fallback="mailgun").split(","):
+        name = name.strip()
+        if name == "mailgun":
+            sinks.append(MailgunSink(
+                PARSER.get("DEFAULT", "MAILGUN_DOMAIN"),
+                PARSER.get("DEFAULT", "MAILGUN_PRIVATE_KEY"),
+                PARSER.get("DEFAULT", "MAILGUN_FROM"),
+            ))
+        elif name == "webhook":
+            sinks.append(WebhookSink(PARSER.get("DEFAULT", "WEBHOOK_URL")))
+        elif name == "file":
+            sinks.append(FileSink(os.path.join(scriptdir, PARSER.get("DEFAULT", "NOTIFY_FILE_DIR", fallback="notifications"))))
+        elif name:
+            print(f"Unknown notification sink: {name}")
+
+    return NotificationDispatcher(
+        os.path.join(scriptdir, PARSER.get("DEFAULT", "OUTBOX_DIR", fallback="outbox")),
+        sinks,
+        timeout=PARSER.getfloat("DEFAULT", "NOTIFY_TIMEOUT", fallback=10),
+        retries=PARSER.getint("DEFAULT", "NOTIFY_RETRIES", fallback=3),
+    )
 
 
 def update_incident_tracking(alert_count: int):
     """
     Adjusts incident tracking info based on number of alerts this run.
-    Starts or ends an incident as needed.
+    Starts or ends an incident as needed. When the results store is available,
+    the failure total is counted from the stored history since the incident started.
     """
     tracking = load_tracking()
     now = now_iso()
@@ -67,6 +259,8 @@ def update_incident_tracking(alert_count: int):
             tracking["incident_active"] = True
             tracking["incident_start"] = now
             tracking["failures_total"] = alert_count
+            if RESULTS_STORE and RESULTS_STORE.last_batch_start:
+                tracking["incident_results_since"] = RESULTS_STORE.last_batch_start
         else:
             tracking["failures_total"] += alert_count
 
@@ -74,6 +268,9 @@ def update_incident_tracking(alert_count: int):
 
         # Update duration
         start_dt = datetime.fromisoformat(tracking["incident_start"]).replace(tzinfo=timezone.utc)
+        if RESULTS_STORE:
+            since = tracking.get("incident_results_since", start_dt.timestamp())
+            tracking["failures_total"] = max(alert_count, RESULTS_STORE.count_failures(since))
         duration = datetime.now(timezone.utc) - start_dt
         mins, secs = divmod(duration.total_seconds(), 60)
         tracking["incident_duration"] = f"{int(mins)}m {int(secs)}s"
@@ -96,324 +293,904 @@ def update_incident_tracking(alert_count: int):
         save_tracking(tracking)
         return tracking
 
+def get_sites_path():
+    return os.path.join(scriptdir, PARSER.get("DEFAULT", "SITES_FILE", fallback="sites.json") or "sites.json")
+
+
 def get_website_dictionary():
-    sites_config_file = open(os.path.join(scriptdir, "sites.json"))
-    sites_to_monitor = json.load(sites_config_file)
-    return sites_to_monitor
+    with open(get_sites_path()) as sites_config_file:
+        return json.load(sites_config_file)
+
+
+def get_sites_config():
+    """
+    Returns the compiled sites.json model, parsing the file only when it has changed
+    since the last call (or since the pickled snapshot was written).
+    """
+    global SITES_CONFIG
+    path = get_sites_path()
+    stat = os.stat(path)
+    if SITES_CONFIG is None or (SITES_CONFIG.mtime_ns, SITES_CONFIG.size) != (stat.st_mtime_ns, stat.st_size):
+        cache = PARSER.get("DEFAULT", "SITES_CACHE_FILE", fallback=".sites.cache")
+        SITES_CONFIG = load_sites_config(path, os.path.join(scriptdir, cache) if cache else None)
+    return SITES_CONFIG
+
+
+def get_monitored_keys():
+    """
+    "site+endpoint" keys this process is responsible for: the enabled endpoints of its
+    shard (all of them on a collector), plus certificate checks of HTTPS sites.
+    None when there is no sites.json to tell.
+    """
+    if not os.path.exists(get_sites_path()):
+        return None
+    tls_enabled = bool(PARSER.get("DEFAULT", "TLS_STATE_FILE", fallback="tls_state.json"))
+    keys = set()
+    for endpoint in get_sites_config().enabled_endpoints:
+        if COLLECTOR_MODE or in_host_shard(endpoint.site):
+            keys.add(f"{endpoint.site}{endpoint.path}")
+            if tls_enabled and endpoint.origin.startswith("https://"):
+                keys.add(f"{endpoint.site}{TLS_ENDPOINT}")
+    return keys
 
 
 def take_endpoint_screenshot(nonce=str, endpoint=str):
-    path = PARSER.get("DEFAULT", "TMP_PATH_SCREENSHOTS")
+    # Hands the screenshot to the worker pool, the check carries on without waiting
+    if DEFERRED_SCREENSHOTS is not None and TAKE_SCREENSHOT and SCREENSHOTS_ENABLED:
+        # Scan worker processes leave screenshots to the parent's browser pool
+        DEFERRED_SCREENSHOTS.append((nonce, endpoint))
+        return
+    if not (TAKE_SCREENSHOT and SCREENSHOTS_ENABLED and SCREENSHOT_POOL):
+        return
+    if not SCREENSHOT_POOL.submit(nonce, endpoint):
+        print(f"📷 Screenshot cap reached, not capturing {endpoint}")
+
+
+def collect_screenshots(wait=True):
+    """
+    Records the files of captured screenshots. With wait, waits for queued screenshots
+    within the per-run time budget; without, only takes those already finished and
+    leaves the rest to a later call, for daemon mode where checks must never wait.
+    """
+    if SCREENSHOT_POOL:
+        budget = PARSER.getfloat("DEFAULT", "SCREENSHOT_TIME_BUDGET", fallback=30)
+        with METRICS.time_phase("screenshot"):
+            for nonce, filename in SCREENSHOT_POOL.drain(budget) if wait else SCREENSHOT_POOL.collect():
+                try:
+                    SCREENSHOTS.append((nonce, ARTIFACTS.store_file(filename, ".png")))
+                except OSError as e:
+                    print(f"Error spooling screenshot {filename}: {e}")
 
-    # Filename based on path and nonce
-    filename = f"{path}/screenshot_{nonce}.png"
 
+async def read_body_excerpt(response, assertions, max_bytes, excerpt_bytes):
+    """
+    Streams the response body in chunks through the endpoint's compiled assertions.
+    Stops as soon as the verdict can't change any more or max_bytes have been read, and
+    returns (failures, excerpt, digest) where failures lists the failed body assertions,
+    excerpt is at most the first excerpt_bytes of the body and digest is a hash of the
+    whole body, or None if reading stopped before its end for either reason.
+    """
+    encoding = response.charset or "utf-8"
     try:
-        BROWSER.get(endpoint)
-        time.sleep(2)  # Adjust the sleep duration based on your requirements
+        codecs.lookup(encoding)
+    except LookupError:
+        encoding = "utf-8"
+    scanner = assertions.scanner(encoding) if assertions else None
+
+    excerpt = bytearray()
+    stopped_early = False
+    bytes_read = 0
+    content_hash = hashlib.blake2b(digest_size=16)
+
+    async for chunk in response.content.iter_chunked(65536):
+        bytes_read += len(chunk)
+        content_hash.update(chunk)
+        if len(excerpt) < excerpt_bytes:
+            excerpt += chunk[:excerpt_bytes - len(excerpt)]
+
+        if scanner:
+            scanner.feed(chunk)
+            if scanner.complete:
+                stopped_early = True
+                break
+
+        if bytes_read >= max_bytes:
+            print(f"   Body limit of {max_bytes} bytes reached, stopped reading")
+            # Only the start of the body was seen, its hash can't tell an unchanged page
+            stopped_early = True
+            break
+
+    failures = scanner.finish() if scanner else []
+    digest = None if stopped_early else content_hash.hexdigest()
+    return failures, excerpt.decode(encoding, errors="replace"), digest
+
+
+def raise_alert(site, endpoint, exception, expected, received, body, headers, capture=True, **extra):
+    """
+    Appends a compact Alert to ALERTS and, when capture is set, queues a screenshot and
+    spools the response body for the email. Returns the alert nonce.
+    """
+    nonce = str(uuid.uuid4().int)[:16]
+    alert = Alert(
+        site,
+        endpoint,
+        exception,
+        expected,
+        received,
+        nonce,
+        excerpt=body[:PARSER.getint("DEFAULT", "EMAIL_BODY_EXCERPT_CHARS", fallback=1000)] if body else body,
+        headers=compact_headers(headers, PARSER.getint("DEFAULT", "EMAIL_MAX_HEADERS", fallback=20)),
+        **extra,
+    )
+    ALERTS.append(alert)
 
-        BROWSER.save_screenshot(filename)
-        SCREENSHOTS.append((nonce, filename))
-    except Exception as e:
-        print(f"Error accessing {endpoint}: {e}")
-        BROWSER.save_screenshot(filename)
-        SCREENSHOTS.append((nonce, filename))
-        # TODO: Handle the error as needed, e.g., log it or take alternative action
+    if capture:
+        take_endpoint_screenshot(nonce, get_sites_config().endpoint(site, endpoint).url)
+        if body and ARTIFACTS:
+            # Identical error pages from many endpoints end up as one file
+            try:
+                alert.artifact = ARTIFACTS.store_text(body)
+                SCREENSHOTS.append((nonce, alert.artifact))
+            except OSError as e:
+                print(f"Error saving HTML for nonce {nonce}: {e}")
+    return nonce
 
 
-async def do_endpoint_check(sites, site, endpoint):
-    print(
-        "- Checking endpoint "
-        + str(endpoint)
-        + " for a status code "
-        + str(sites["sites"][site]["endpoints"][endpoint]["status"])
+def check_latency_slo(site, endpoint, endpoint_config, result):
+    """
+    Feeds the latency into the rolling percentiles and raises an alert when the check
+    exceeds max_latency_ms or the rolling p95 exceeds warn_latency_ms.
+    Returns the alert exception, or None if no alert was raised.
+    """
+    if LATENCY_TRACKER is None:
+        return None
+
+    latency_ms = result["latency_ms"]
+    percentiles = LATENCY_TRACKER.observe(site, endpoint, latency_ms)
+    max_latency = endpoint_config.max_latency_ms
+    warn_latency = endpoint_config.warn_latency_ms
+    min_samples = PARSER.getint("DEFAULT", "LATENCY_MIN_SAMPLES", fallback=10)
+
+    if max_latency is not None and latency_ms > max_latency:
+        exception = "Latency SLO breach"
+        threshold = max_latency
+    elif (
+        warn_latency is not None
+        and percentiles["samples"] >= min_samples
+        and percentiles["p95"] > warn_latency
+    ):
+        exception = "Latency SLO warning"
+        threshold = warn_latency
+    else:
+        return None
+
+    raise_alert(
+        site,
+        endpoint,
+        exception,
+        int(threshold),
+        result["status"],
+        result["body"],
+        result["headers"],
+        capture=False,
+        latency_ms=latency_ms,
+        percentiles=percentiles,
     )
+    return exception
+
 
-    timeout = aiohttp.ClientTimeout(total=5)
+async def fetch_endpoint(session, site, endpoint, endpoint_config, method="GET"):
+    """
+    Makes a single request to the endpoint and returns a result dict with the status,
+    body excerpt, headers, failed content and header assertions, latency and any error.
+    """
+    timeout = aiohttp.ClientTimeout(
+        total=endpoint_config.timeout or PARSER.getfloat("DEFAULT", "CHECK_TIMEOUT", fallback=5)
+    )
     headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 PythonMonitorScript/1.0",
+        "User-Agent": USER_AGENT,
         "Accept": "*/*",
-        "Connection": "close",
+    }
+    result = {
+        "status": 0,
+        "body": None,
+        "headers": None,
+        "assertion_failures": [],
+        "latency_ms": 0,
+        "error": None,
     }
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "https://" + str(site) + str(endpoint), timeout=timeout, headers=headers
-            ) as response:
-                response_body = await response.text()
-                response_headers = response.headers
-                expected_status = int(sites["sites"][site]["endpoints"][endpoint]["status"])
-                alert_raised = False
-
-                if response.status != expected_status:
-                    status_nonce = str(uuid.uuid4().int)[:16]
-                    ALERTS.append({
-                        "alert": {
-                            "site": site,
-                            "endpoint": endpoint,
-                            "expected": expected_status,
-                            "received": response.status,
-                            "exception": "Status code mismatch",
-                            "nonce": status_nonce,
-                            "body": response_body,
-                            "headers": response_headers,
-                        }
-                    })
-                    alert_raised = True
-
-                    if TAKE_SCREENSHOT and SCREENSHOTS_ENABLED:
-                        take_endpoint_screenshot(status_nonce, f"https://{site}{endpoint}")
-                    html_path = save_html_to_file(status_nonce, response_body)
-                    if html_path:
-                        SCREENSHOTS.append((status_nonce, html_path))
-
-                search_key = sites["sites"][site]["endpoints"][endpoint]["dom_contains"]
-                if search_key and search_key not in response_body:
-                    dom_nonce = str(uuid.uuid4().int)[:16]
-                    ALERTS.append({
-                        "alert": {
-                            "site": site,
-                            "endpoint": endpoint,
-                            "expected": 0,
-                            "received": 0,
-                            "exception": "DOM string mismatch",
-                            "nonce": dom_nonce,
-                            "body": response_body,
-                            "headers": response_headers,
-                        }
-                    })
-                    alert_raised = True
-
-                    if TAKE_SCREENSHOT:
-                        take_endpoint_screenshot(dom_nonce, f"https://{site}{endpoint}")
-                    html_path = save_html_to_file(dom_nonce, response_body)
-                    if html_path:
-                        SCREENSHOTS.append((dom_nonce, html_path))
-
-                if alert_raised:
-                    print(f"❌ Alert raised for {site}{endpoint} - Exception: {ALERTS[-1]['alert']['exception']}")
-                else:
-                    print(f"   ✅ Passed: {endpoint}")
+    # Revalidate with the last response's ETag / Last-Modified instead of re-downloading it
+    assertions = endpoint_config.assertions
+    assertions_key = assertions.key if assertions else None
+    cached = RESPONSE_CACHE.get(site, endpoint, assertions_key) if RESPONSE_CACHE and method == "GET" else None
+    if cached:
+        headers.update(RESPONSE_CACHE.conditional_headers(cached))
 
+    # Waits for a per-host slot and rate limit token, the wait isn't counted as latency
+    limiter = HOST_LIMITS.get(endpoint_config.origin, endpoint_config.host_limits) if HOST_LIMITS else None
+    if limiter:
+        await limiter.acquire()
+
+    started = time.monotonic()
+    try:
+        async with session.request(
+            method,
+            endpoint_config.url,
+            timeout=timeout,
+            headers=headers,
+            trace_request_ctx={"site": site, "endpoint": endpoint},
+        ) as response:
+            expected_status = endpoint_config.status
+            result["status"] = response.status
+            result["headers"] = response.headers
+            result["body"] = ""
+
+            if cached and response.status == 304:
+                # Unchanged since the last check, its status and assertion verdict still hold
+                result["status"] = cached["status"]
+                result["assertion_failures"] = [tuple(failure) for failure in cached["failures"]]
+                result["cache"] = "not_modified"
+                print(f"   304 Not Modified, reusing the cached result for {site}{endpoint}")
+            elif method == "GET":
+                if assertions:
+                    result["assertion_failures"] = assertions.check_headers(response.headers)
+
+                # Status-only checks can opt out of downloading the body when the status matches
+                needs_body = assertions and assertions.needs_body
+                if needs_body or response.status != expected_status or not endpoint_config.skip_body:
+                    body_failures, result["body"], digest = await read_body_excerpt(
+                        response,
+                        assertions,
+                        endpoint_config.max_body_bytes or PARSER.getint("DEFAULT", "MAX_BODY_BYTES", fallback=1048576),
+                        PARSER.getint("DEFAULT", "ALERT_EXCERPT_BYTES", fallback=4096),
+                    )
+                    result["assertion_failures"] += body_failures
+                    # Only counted in the metrics, the verdict above was computed from this body
+                    if cached and digest and cached["hash"] == digest and cached["status"] == response.status:
+                        result["cache"] = "same_hash"
+                    if RESPONSE_CACHE:
+                        RESPONSE_CACHE.store(
+                            site,
+                            endpoint,
+                            assertions_key,
+                            response.status,
+                            result["assertion_failures"],
+                            etag=response.headers.get("ETag"),
+                            last_modified=response.headers.get("Last-Modified"),
+                            digest=digest,
+                        )
+    except aiohttp.ClientConnectorCertificateError as ex:
+        result["error"] = f"Certificate verification failed: {getattr(ex.certificate_error, 'verify_message', ex.certificate_error)}"
+    except aiohttp.ClientConnectorError as ex:
+        # DNS failures get their own message instead of aiohttp's generic connect error
+        if isinstance(ex.os_error, DNSResolutionError):
+            result["error"] = str(ex.os_error)
+        else:
+            result["error"] = str(ex) or "Unreachable, response code is 0"
     except Exception as ex:
-        message = str(ex) or "Unreachable, response code is 0"
+        result["error"] = str(ex) or "Unreachable, response code is 0"
+    finally:
+        if limiter:
+            limiter.release()
+
+    result["latency_ms"] = (time.monotonic() - started) * 1000
+    if cached:
+        METRICS.inc("monitor_response_cache", outcome=result.get("cache", "changed"))
+    return result
+
+
+def get_failures(result, endpoint_config):
+    """
+    Returns a list of (exception, expected, received, detail) for everything wrong with a
+    result. received is always the status code, what a failed assertion found is in detail.
+    """
+    expected_status = endpoint_config.status
+    if result["error"]:
+        return [(result["error"], expected_status, 0, None)]
+
+    failures = []
+    if result["status"] != expected_status:
+        failures.append(("Status code mismatch", expected_status, result["status"], None))
+    failures.extend(
+        (exception, expected, result["status"], detail) for exception, expected, detail in result["assertion_failures"]
+    )
+    return failures
+
+
+def carry_open_circuit_alert(site, endpoint, circuit):
+    # Keeps a known-down endpoint in ALERTS without re-capturing screenshots or bodies
+    for exception, expected, received, detail in CIRCUITS.last_failures(circuit):
+        raise_alert(
+            site,
+            endpoint,
+            exception,
+            expected,
+            received,
+            None,
+            None,
+            capture=False,
+            circuit_open=True,
+            detail=detail,
+        )
+
+
+async def do_endpoint_check(sites, site, endpoint, session=None):
+    # Without a shared session, fall back to a one-shot session that closes its socket
+    if session is None:
+        async with aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(resolver=RESOLVER, use_dns_cache=False) if RESOLVER else None,
+            headers={"Connection": "close"},
+            trace_configs=[create_trace_config(METRICS)],
+        ) as session:
+            return await do_endpoint_check(sites, site, endpoint, session)
+
+    endpoint_config = sites.endpoint(site, endpoint)
+    CHECKED_ENDPOINTS.add(f"{site}{endpoint}")
+    print(
+        "- Checking endpoint "
+        + str(endpoint)
+        + " for a status code "
+        + str(endpoint_config.status)
+    )
+
+    # Known-down endpoints are only probed occasionally, with a HEAD request
+    circuit = CIRCUITS.get_open(site, endpoint) if CIRCUITS else None
+    if circuit:
+        if not CIRCUITS.probe_due(circuit):
+            print(f"   ⏸️ Circuit open for {site}{endpoint}, next probe in {CIRCUITS.seconds_until_probe(circuit):.0f}s")
+            # Still a failed check, so history, availability and failure counts cover the outage
+            record_result(site, endpoint, 0, None, CIRCUITS.last_failures(circuit)[0][0], outcome="circuit_open")
+            carry_open_circuit_alert(site, endpoint, circuit)
+            return
+
+        probe = await fetch_endpoint(session, site, endpoint, endpoint_config, method="HEAD")
+        # Some servers don't implement HEAD, a full check settles those
+        if probe["error"] or probe["status"] not in (endpoint_config.status, 405, 501):
+            print(f"   ⏸️ Circuit probe failed for {site}{endpoint}, still down")
+            failures = get_failures(probe, endpoint_config)
+            # A HEAD probe can't check the body, so an outage that still fails the same way keeps
+            # the full failure list and with it the incident's fingerprint
+            carried = CIRCUITS.last_failures(circuit)
+            if any(failure[:3] == failures[0][:3] for failure in carried):
+                failures = carried
+            CIRCUITS.record_failure(site, endpoint, failures)
+            record_result(site, endpoint, probe["status"], probe["latency_ms"], failures[0][0])
+            carry_open_circuit_alert(site, endpoint, circuit)
+            return
+        print(f"   Circuit probe passed for {site}{endpoint}, running full check")
+
+    result = await fetch_endpoint(session, site, endpoint, endpoint_config)
+    failures = get_failures(result, endpoint_config)
+
+    # Confirm failures before alerting so a single transient error doesn't trigger the alert path
+    retries = PARSER.getint("DEFAULT", "CONFIRM_RETRIES", fallback=2)
+    backoff = PARSER.getfloat("DEFAULT", "CONFIRM_BACKOFF", fallback=0.5)
+    attempt = 0
+    while failures and attempt < retries:
+        delay = backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        print(f"   🔁 {site}{endpoint} failed ({failures[0][0]}), confirming in {delay:.2f}s")
+        await asyncio.sleep(delay)
+        attempt += 1
+        result = await fetch_endpoint(session, site, endpoint, endpoint_config)
+        failures = get_failures(result, endpoint_config)
+
+    if result["error"]:
         print("endpoint seems to be unreachable, response code is 0")
-        print("exception: " + message)
+        print("exception: " + result["error"])
 
-        fallback_nonce = str(uuid.uuid4().int)[:16]
-        ALERTS.append({
-            "alert": {
-                "site": site,
-                "endpoint": endpoint,
-                "expected": int(sites["sites"][site]["endpoints"][endpoint]["status"]),
-                "received": 0,
-                "exception": message,
-                "nonce": fallback_nonce,
-                "body": None,
-                "headers": None,
-            }
-        })
+    for exception, expected, received, detail in failures:
+        raise_alert(site, endpoint, exception, expected, received, result["body"], result["headers"], detail=detail)
 
-        if TAKE_SCREENSHOT:
-            take_endpoint_screenshot(fallback_nonce, f"https://{site}{endpoint}")
+    exception = failures[0][0] if failures else None
+    if not result["error"]:
+        exception = check_latency_slo(site, endpoint, endpoint_config, result) or exception
 
+    if exception:
+        print(f"❌ Alert raised for {site}{endpoint} - Exception: {exception}")
+        record_result(site, endpoint, result["status"], result["latency_ms"], exception)
+    else:
+        if attempt:
+            print(f"   ✅ Passed after {attempt} retr{'y' if attempt == 1 else 'ies'}: {endpoint}")
+        else:
+            print(f"   ✅ Passed: {endpoint}")
+        record_result(site, endpoint, result["status"], result["latency_ms"])
+
+    if CIRCUITS:
+        if failures:
+            if CIRCUITS.record_failure(site, endpoint, failures):
+                print(f"   ⛔ Circuit opened for {site}{endpoint}")
+        elif CIRCUITS.record_success(site, endpoint):
+            print(f"   🔌 Circuit closed for {site}{endpoint}")
 
 
 def do_heartbeat_check(sites):
+    global HOST_LIMITS, RESOLVER
     print("do_heartbeat_check started")
+    HOST_LIMITS = create_host_limits()
+    RESOLVER = create_resolver()
     loop = asyncio.get_event_loop()
-    for site in sites["sites"]:
-        should_check = sites["sites"][site]["check"]
-        if should_check:
+    pairs = []
+    for site in sites.sites.values():
+        if not in_host_shard(site.name):
+            continue
+        if site.check:
             print("    ")
-            print("Starting checks for " + site)
-            for endpoint in sites["sites"][site]["endpoints"]:
-                loop.run_until_complete(do_endpoint_check(sites, site, endpoint))
+            print("Starting checks for " + site.name)
+            for endpoint in site.endpoints:
+                loop.run_until_complete(do_endpoint_check(sites, site.name, endpoint))
+                pairs.append((site.name, endpoint))
         else:
-            print("check variable set to false for " + site)
+            print("check variable set to false for " + site.name)
+    loop.run_until_complete(check_tls(sites, pairs))
+    loop.run_until_complete(RESOLVER.close())
 
     print("do_heartbeat_check ended")
 
 
-# Function to get the number of checks (endpoints) for a given site
-def get_num_of_checks(site_name):
-    # Check if the site exists in the config
-    domains = get_website_dictionary()["sites"]
-    if site_name in domains:
-        # Return the number of endpoints (checks) for the given site
-        return len(domains[site_name]["endpoints"])
-    else:
-        # If site does not exist in config, return 0 or a message
-        return 0  # Or return an error message if preferred
+def get_enabled_endpoints(sites):
+    # (site, endpoint) pairs for every site with check enabled that belongs to this host's shard
+    for site in sites.sites.values():
+        if not site.check:
+            print("check variable set to false for " + site.name)
+    return [
+        (endpoint.site, endpoint.path) for endpoint in sites.enabled_endpoints if in_host_shard(endpoint.site)
+    ]
+
+
+def get_cli_value(name, default=None):
+    # Reads --name=value style arguments
+    prefix = f"--{name}="
+    for arg in sys.argv:
+        if arg.startswith(prefix):
+            return arg[len(prefix):]
+    return default
+
+
+def shard_for(site, shard_count):
+    # Deterministic across processes and hosts, unlike hash() which is salted per process
+    return zlib.crc32(site.encode("utf-8")) % shard_count
+
+
+def get_host_shard():
+    """
+    Returns (index, count) for this host from --shard=I/N or SCAN_SHARD in config.ini.
+    Sites are assigned to hosts by a hash of the site name, so every host agrees on the split.
+    """
+    value = get_cli_value("shard", PARSER.get("DEFAULT", "SCAN_SHARD", fallback="0/1"))
+    index, count = (int(part) for part in value.split("/"))
+    if not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value}, expected I/N with 0 <= I < N")
+    return index, count
+
+
+def in_host_shard(site):
+    index, count = get_host_shard()
+    return count == 1 or shard_for(site, count) == index
+
+
+def create_host_limits():
+    """
+    Per-origin concurrency and rate limits for the current event loop. Sites without
+    host_limits in sites.json use HOST_CONCURRENCY, HOST_RATE and HOST_BURST.
+    """
+    rate = PARSER.getfloat("DEFAULT", "HOST_RATE", fallback=0)
+    return HostLimits(
+        default_concurrency=PARSER.getint(
+            "DEFAULT", "HOST_CONCURRENCY", fallback=PARSER.getint("DEFAULT", "SCAN_LIMIT_PER_HOST", fallback=10)
+        ),
+        default_rate=rate or None,
+        default_burst=PARSER.getint("DEFAULT", "HOST_BURST", fallback=1),
+    )
+
 
-def save_html_to_file(nonce: str, html: str) -> str:
-    path = PARSER.get("DEFAULT", "TMP_PATH_SCREENSHOTS")
-    filename = os.path.join(path, f"response_{nonce}.txt")
+def create_resolver():
+    return CachingResolver(
+        ttl=PARSER.getint("DEFAULT", "SCAN_DNS_CACHE_TTL", fallback=300),
+        negative_ttl=PARSER.getint("DEFAULT", "DNS_NEGATIVE_CACHE_TTL", fallback=30),
+    )
+
+
+async def probe_tls_origin(origin, host_limits=None):
+    # host_limits are the origin's limits from sites.json, the probe counts against them like a check
+    limiter = HOST_LIMITS.get(origin, host_limits) if HOST_LIMITS else None
+    if limiter:
+        await limiter.acquire()
     try:
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(html)
-        return filename
-    except Exception as e:
-        print(f"Error saving HTML for nonce {nonce}: {e}")
-        return None
+        entry = await TLS_MONITOR.probe(origin, RESOLVER)
+    finally:
+        if limiter:
+            limiter.release()
+
+    if entry["handshake_ms"] is not None:
+        METRICS.observe("monitor_tls_handshake_seconds", entry["handshake_ms"] / 1000, origin=origin)
+        days = (entry["expires_at"] - time.time()) / 86400
+        print(f"🔒 {origin}: handshake {entry['handshake_ms']:.0f} ms, certificate expires in {days:.0f} days ({entry['issuer']})")
+    else:
+        print(f"🔒 {origin}: {entry['error']}")
+
+
+async def check_tls(sites, pairs):
+    """
+    Probes each HTTPS origin among pairs once (when its TLS_PROBE_INTERVAL is up) and
+    raises a certificate alert for every site served from an origin with a problem.
+    """
+    if not TLS_MONITOR:
+        return
+    origin_sites = {}
+    origin_limits = {}
+    for site, endpoint in pairs:
+        endpoint_config = sites.endpoint(site, endpoint)
+        origin = endpoint_config.origin
+        if origin.startswith("https://"):
+            origin_sites.setdefault(origin, {})[site] = None
+            origin_limits[origin] = endpoint_config.host_limits
+
+    await asyncio.gather(*(
+        probe_tls_origin(origin, origin_limits[origin]) for origin in origin_sites if TLS_MONITOR.probe_due(origin)
+    ))
+
+    for origin, site_names in origin_sites.items():
+        failures = TLS_MONITOR.failures(origin)
+        for site in site_names:
+            CHECKED_ENDPOINTS.add(f"{site}{TLS_ENDPOINT}")
+            for exception, expected, received in failures:
+                print(f"❌ Alert raised for {site} - {origin}: {exception}")
+                raise_alert(site, TLS_ENDPOINT, exception, expected, received, None, None, capture=False)
+
+
+def get_spread_window(sites, pairs):
+    """
+    Seconds over which a scan spreads each host's checks, SCAN_SPREAD_SECONDS capped so the
+    last check, with its confirm retries, still finishes inside SCAN_INTERVAL_SECONDS.
+    """
+    interval = PARSER.getfloat("DEFAULT", "SCAN_INTERVAL_SECONDS", fallback=60)
+    warn_rate_limited_hosts(sites, pairs, interval)
+
+    window = PARSER.getfloat("DEFAULT", "SCAN_SPREAD_SECONDS", fallback=0)
+    if window <= 0 or not pairs:
+        return 0
+
+    retries = PARSER.getint("DEFAULT", "CONFIRM_RETRIES", fallback=2)
+    backoff = PARSER.getfloat("DEFAULT", "CONFIRM_BACKOFF", fallback=0.5)
+    default_timeout = PARSER.getfloat("DEFAULT", "CHECK_TIMEOUT", fallback=5)
+    timeout = max(sites.endpoint(site, endpoint).timeout or default_timeout for site, endpoint in pairs)
+    worst_check = timeout * (retries + 1) + sum(backoff * 1.5 * 2 ** attempt for attempt in range(retries))
+    if window > interval - worst_check:
+        window = max(0.0, interval - worst_check)
+        print(f"SCAN_SPREAD_SECONDS capped to {window:.1f}s to finish inside the {interval:.0f}s scan interval")
+    return window
+
+
+def warn_rate_limited_hosts(sites, pairs, interval):
+    # A host whose rate limit can't fit all of its checks into one interval overruns every scan
+    default_rate = PARSER.getfloat("DEFAULT", "HOST_RATE", fallback=0)
+    counts = {}
+    rates = {}
+    for site, endpoint in pairs:
+        endpoint_config = sites.endpoint(site, endpoint)
+        counts[endpoint_config.origin] = counts.get(endpoint_config.origin, 0) + 1
+        limits = endpoint_config.host_limits
+        rates[endpoint_config.origin] = (limits[1] if limits and limits[1] else None) or default_rate
+    for origin, count in counts.items():
+        rate = rates[origin]
+        if rate and count / rate > interval:
+            print(f"⚠️ {origin} needs {count / rate:.0f}s for {count} check(s) at {rate:g}/s, longer than the {interval:.0f}s scan interval")
+
+
+def create_scan_session():
+    """
+    Builds the pooled keep-alive session shared by all checks in a scan,
+    along with the semaphore that bounds the number of checks in flight.
+    Also sets up HOST_LIMITS for the event loop the session runs on.
+    """
+    global HOST_LIMITS, RESOLVER
+    HOST_LIMITS = create_host_limits()
+    RESOLVER = create_resolver()
+    concurrency = PARSER.getint("DEFAULT", "SCAN_CONCURRENCY", fallback=100)
+    per_host = PARSER.getint("DEFAULT", "SCAN_LIMIT_PER_HOST", fallback=10)
+
+    # Lookups are cached by RESOLVER (for SCAN_DNS_CACHE_TTL), which TLS probes share
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=per_host,
+        resolver=RESOLVER,
+        use_dns_cache=False,
+    )
+    session = aiohttp.ClientSession(connector=connector, trace_configs=[create_trace_config(METRICS)])
+    return session, asyncio.Semaphore(concurrency)
+
+
+async def check_endpoints(sites, pairs, session, semaphore, spread=0):
+    # With spread, each host's checks start at even offsets across that many seconds
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    offsets = spread_offsets([sites.endpoint(site, endpoint) for site, endpoint in pairs], spread) if spread else {}
+
+    async def bounded_check(site, endpoint):
+        delay = started + offsets.get((site, endpoint), 0) - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with semaphore:
+            await do_endpoint_check(sites, site, endpoint, session)
 
+    await asyncio.gather(check_tls(sites, pairs), *(bounded_check(site, endpoint) for site, endpoint in pairs))
 
-def get_email_markup():
+
+async def do_concurrent_scan(sites, pairs=None):
+    # Checks every enabled endpoint (or just the given pairs) at once over a single pooled session
+    pairs = get_enabled_endpoints(sites) if pairs is None else pairs
+    session, semaphore = create_scan_session()
+    async with session:
+        await check_endpoints(sites, pairs, session, semaphore, spread=get_spread_window(sites, pairs))
+    await RESOLVER.close()
+
+
+def do_concurrent_heartbeat_check(sites):
+    print("do_concurrent_heartbeat_check started")
+    started = time.monotonic()
+    asyncio.run(do_concurrent_scan(sites))
+    print(f"do_concurrent_heartbeat_check ended in {time.monotonic() - started:.2f}s")
+
+
+def get_scan_workers():
+    return int(get_cli_value("workers", PARSER.get("DEFAULT", "SCAN_WORKERS", fallback="1")))
+
+
+def scan_shard(pairs):
+    """
+    Runs in a worker process: checks the given (site, endpoint) pairs on its own event loop
+    and returns everything the parent needs to merge the shard into one alert set.
+    """
+    global SCREENSHOTS_ENABLED, RESULTS_STORE, LATENCY_TRACKER, CIRCUITS, RESPONSE_CACHE, ARTIFACTS, TLS_MONITOR
+    global DEFERRED_SCREENSHOTS
+    PARSER.read("config.ini")
+    SCREENSHOTS_ENABLED = PARSER.getboolean("DEFAULT", "SCREENSHOTS_ENABLED", fallback=False)
+    DEFERRED_SCREENSHOTS = []
+    RESULTS_STORE = open_results_store()
+    LATENCY_TRACKER = open_latency_tracker()
+    CIRCUITS = open_circuit_breakers()
+    RESPONSE_CACHE = open_response_cache()
+    ARTIFACTS = open_artifact_spool()
+    TLS_MONITOR = open_tls_monitor()
+
+    sites = get_sites_config()
+    asyncio.run(do_concurrent_scan(sites, pairs))
+
+    batch_start = None
+    if RESULTS_STORE:
+        RESULTS_STORE.flush()
+        batch_start = RESULTS_STORE.last_batch_start
+        RESULTS_STORE.close()
+
+    keys = {f"{site}{endpoint}" for site, endpoint in pairs}
+    origins = {sites.endpoint(site, endpoint).origin for site, endpoint in pairs}
+    return {
+        "keys": keys | CHECKED_ENDPOINTS,
+        "alerts": ALERTS,
+        "artifacts": SCREENSHOTS,
+        "screenshots": DEFERRED_SCREENSHOTS,
+        "batch_start": batch_start,
+        "circuits": {key: value for key, value in CIRCUITS.circuits.items() if key in keys} if CIRCUITS else {},
+        "latency": {key: value for key, value in LATENCY_TRACKER.sketches.items() if key in keys},
+        "responses": {key: value for key, value in RESPONSE_CACHE.entries.items() if key in keys} if RESPONSE_CACHE else {},
+        "tls": {key: value for key, value in TLS_MONITOR.origins.items() if key in origins} if TLS_MONITOR else {},
+        "metrics": METRICS.snapshot(),
+    }
+
+
+def merge_shard(shard):
+    # Folds one worker's results into this process's alerts and state
+    ALERTS.extend(shard["alerts"])
+    SCREENSHOTS.extend(shard["artifacts"])
+    CHECKED_ENDPOINTS.update(shard["keys"])
+    for nonce, url in shard["screenshots"]:
+        take_endpoint_screenshot(nonce, url)
+
+    if RESULTS_STORE and shard["batch_start"]:
+        RESULTS_STORE.last_batch_start = min(RESULTS_STORE.last_batch_start or shard["batch_start"], shard["batch_start"])
+    if CIRCUITS:
+        for key in shard["keys"]:
+            CIRCUITS.circuits.pop(key, None)
+        CIRCUITS.circuits.update(shard["circuits"])
+    if LATENCY_TRACKER:
+        LATENCY_TRACKER.sketches.update(shard["latency"])
+    if RESPONSE_CACHE:
+        RESPONSE_CACHE.update(shard["responses"])
+    if TLS_MONITOR:
+        TLS_MONITOR.origins.update(shard["tls"])
+    METRICS.merge(shard["metrics"])
+
+
+def do_sharded_heartbeat_check(sites, workers):
+    """
+    Splits the endpoints across worker processes by site, so each site's connections
+    stay in one pool, and merges their results before any alerting happens.
+    """
+    print(f"do_sharded_heartbeat_check started with {workers} worker(s)")
+    started = time.monotonic()
+
+    shards = [[] for _ in range(workers)]
+    for site, endpoint in get_enabled_endpoints(sites):
+        shards[shard_for(site, workers)].append((site, endpoint))
+    shards = [pairs for pairs in shards if pairs]
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # spawn rather than fork so workers don't inherit this process's SQLite connection
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(shards) or 1, mp_context=context) as pool:
+        for shard in pool.map(scan_shard, shards):
+            merge_shard(shard)
+
+    print(f"do_sharded_heartbeat_check ended in {time.monotonic() - started:.2f}s")
+
+
+def use_concurrent_scan():
+    # The concurrent engine can be picked per run with --concurrent or in config.ini
+    return CONCURRENT_SCAN or PARSER.get("DEFAULT", "SCAN_ENGINE", fallback="serial") == "concurrent"
+
+
+# Function to get the number of checks (endpoints) for a given site
+def get_num_of_checks(site_name):
+    # Counts are precomputed when sites.json is loaded, 0 if the site isn't in the config
+    # or there is no config, as on a collector. HTTPS sites add their certificate check
+    if SITES_CONFIG is None and not os.path.exists(get_sites_path()):
+        return 0
+    sites = get_sites_config()
+    count = sites.get_num_of_checks(site_name)
+    # The certificate check of an HTTPS site counts too, its alerts use the [TLS] pseudo-endpoint
+    site = sites.sites.get(site_name)
+    if (
+        site is not None
+        and PARSER.get("DEFAULT", "TLS_STATE_FILE", fallback="tls_state.json")
+        and any(endpoint.origin.startswith("https://") for endpoint in site.endpoints.values())
+    ):
+        count += 1
+    return count
+
+def get_email_markup(alerts=None, referenced=None):
     print("get_email_markup started")
 
-    html_body = ""
+    # Identical failures across a site's endpoints are collapsed, bodies and header lists are capped
+    return render_alerts(
+        ALERTS if alerts is None else alerts,
+        get_num_of_checks,
+        show_headers=SHOW_HEADERS,
+        screenshots_enabled=SCREENSHOTS_ENABLED is True,
+        max_body_chars=PARSER.getint("DEFAULT", "EMAIL_BODY_EXCERPT_CHARS", fallback=1000),
+        max_headers=PARSER.getint("DEFAULT", "EMAIL_MAX_HEADERS", fallback=20),
+        referenced=referenced,
+    )
 
-    # Step 1: Group the alerts by "site"
-    grouped_alerts = {}
-    for alert in ALERTS:
-        site = alert["alert"]["site"]
-        if site not in grouped_alerts:
-            grouped_alerts[site] = []
-        grouped_alerts[site].append(alert)
-
-    # Step 2: Iterate through the grouped alerts
-    for site, alerts in grouped_alerts.items():
-        # Count the number of failed checks
-        unique_failures = {a["alert"]["endpoint"] for a in alerts}
-        failed_checks = len(unique_failures)
-
-        # Get the total number of checks for the domain (from config)
-        total_checks_for_domain = get_num_of_checks(site)
-
-        # Header message
-        html_body += f"<span style='color: #dc818f;'>{failed_checks} of {total_checks_for_domain} checks failed for {site}</span><br>"
-
-        # Step 3: Loop through each alert for this site
-        for alert in alerts:
-            html_body += f"<strong>Endpoint:</strong> {alert['alert']['endpoint']} <br>"
-            html_body += (
-                f"<strong>Response Code:</strong> {alert['alert']['received']} <br>"
+def format_minutes(seconds):
+    mins, secs = divmod(int(seconds), 60)
+    return f"{mins}m {secs}s"
+
+
+def get_digest_markup(digest, referenced=None):
+    """
+    Renders a notification digest: one line per site with open incidents, new incidents
+    in full, ongoing and recovered incidents as one line each so they aren't re-rendered
+    on every email.
+    """
+    now = time.time()
+    out = []
+
+    if digest["sites"]:
+        out.append(f"<h3>Sites with open incidents ({len(digest['sites'])})</h3>")
+        for site, summary in sorted(digest["sites"].items()):
+            out.append(
+                f"{escape(site)} — {len(summary['endpoints'])} endpoint(s) failing, "
+                f"for {format_minutes(now - summary['opened_at'])}<br>"
+            )
+        out.append("<br>")
+
+    if digest["new"]:
+        new_keys = {f"{incident['site']}{incident['endpoint']}" for incident in digest["new"]}
+        new_alerts = [
+            alert for alert in ALERTS if alert.key in new_keys
+        ]
+        out.append(f"<h3>New incidents ({len(digest['new'])})</h3>")
+        out.append(get_email_markup(new_alerts, referenced))
+
+    if digest["ongoing"]:
+        out.append(f"<h3>Ongoing incidents ({len(digest['ongoing'])})</h3>")
+        for incident in digest["ongoing"]:
+            key = escape(f"{incident['site']}{incident['endpoint']}")
+            out.append(
+                f"{key} — {escape(', '.join(incident['exceptions']))}, "
+                f"open for {format_minutes(now - incident['opened_at'])} "
+                f"(acknowledge with --ack={key})<br>"
             )
+        out.append("<br>")
+
+    if digest["recovered"]:
+        out.append(f"<h3>Recovered ({len(digest['recovered'])})</h3>")
+        for incident in digest["recovered"]:
+            out.append(
+                f"{escape(incident['site'] + incident['endpoint'])} — recovered after "
+                f"{format_minutes(incident['resolved_at'] - incident['opened_at'])}<br>"
+            )
+        out.append("<br>")
 
-            if alert["alert"]["exception"]:
-                html_body += (
-                    f"<strong>Exception:</strong> {alert['alert']['exception']} <br>"
-                )
-
-            # Debug nonce
-            html_body += f"<strong>Nonce:</strong> {alert['alert']['nonce']} <br>"
-
-            if SCREENSHOTS_ENABLED is True:
-                # Inline pictures from Selenium using the nonce as part of the image CID
-                html_body += f"<strong>Screenshot:</strong><br><img src='cid:{alert['alert']['nonce']}.png' alt='Nonce Image'><br>"
-
-            # Optionally, add headers if they exist
-            if SHOW_HEADERS:
-                if alert["alert"]["headers"] and isinstance(
-                    alert["alert"]["headers"], CIMultiDictProxy
-                ):
-                    html_body += "<strong>Headers:</strong><br>"
-                    header_data = alert["alert"]["headers"]
-                    for key, value in header_data.items():
-                        html_body += f"- <strong><i>{key}:</i></strong> {value} <br>"
-
-                if alert["alert"]["body"]:
-                    html_body += (
-                        f"<strong>Body:</strong> {str(alert['alert']['body'])} <br>"
-                    )
-            html_body += "<br>"
-        # Optionally, add a separator for each site's alerts
-        html_body += "<hr><br>"
+    return "".join(out)
+
+
+def get_email_template():
+    # Compiled once per process, rendering is then a single join
+    global EMAIL_TEMPLATE
+    if EMAIL_TEMPLATE is None:
+        with open(os.path.join(scriptdir, "email-content.html")) as f:
+            EMAIL_TEMPLATE = CompiledTemplate(f.read())
+    return EMAIL_TEMPLATE
 
-    return html_body
 
 def send_urgent_email(
     html_body,
     failure_count=0,
     incident_start_timestamp_delta=str,
     incident_start_timestamp=str,
-    to_address=str
+    to_address=str,
+    nonces=None
 ):
     print("send_urgent_email started")
-    print("pulling email template")
-    html_template = open(os.path.join(scriptdir, "email-content.html"))
-    html_template = html_template.read()
-    print("replacing variables in the template")
-    html_template = str(html_template).replace("{{replace_alerts}}", html_body)
-    html_template = str(html_template).replace("{{failure_count}}", str(failure_count))
-    html_template = str(html_template).replace(
-        "{{incident_start_timestamp_delta}}", str(incident_start_timestamp_delta)
-    )
-    html_template = str(html_template).replace(
-        "{{incident_start_timestamp_pretty}}",
-        str(incident_start_timestamp),
+    html_template = get_email_template().render(
+        replace_alerts=html_body,
+        failure_count=failure_count,
+        incident_start_timestamp_delta=incident_start_timestamp_delta,
+        incident_start_timestamp_pretty=incident_start_timestamp,
     )
 
-    files = []
-    added_filenames = set()
+    attachments = []
+    added = set()
 
     for nonce, filename in SCREENSHOTS:
-        if not filename or filename in added_filenames:
+        # Only attach artifacts of alerts that made it into the email
+        if not filename or (nonce, filename) in added:
+            continue
+        if nonces is not None and nonce not in nonces:
             continue
-        added_filenames.add(filename)
+        added.add((nonce, filename))
 
-        try:
-            with open(filename, "rb") as file_obj:
-                file_content = file_obj.read()
-                file_ext = os.path.splitext(filename)[1].lower()
-
-                if file_ext == ".png":
-                    files.append(("inline", (f"{nonce}.png", file_content)))
-                elif file_ext == ".txt":
-                    files.append(("attachment", (f"{nonce}.txt", file_content)))
-        except FileNotFoundError:
+        if not os.path.exists(filename):
             print(f"File not found: {filename}")
-        except Exception as e:
-            print(f"Error reading {filename}: {e}")
-
-    print(f"posting request to mailgun... to {to_address}")
-    email_post = requests.post(
-        f"https://api.mailgun.net/v3/{PARSER.get('DEFAULT', 'MAILGUN_DOMAIN')}/messages",
-        auth=("api", PARSER.get("DEFAULT", "MAILGUN_PRIVATE_KEY")),
-        files=files,
-        data={
-            "from": PARSER.get("DEFAULT", "MAILGUN_FROM"),
-            "to": [to_address],
-            "subject": "URGENT NOTIFICATION - PythonMonitorScript",
-            "html": html_template,
-        },
+            continue
+
+        # Attachments are streamed from disk at delivery time rather than read in here
+        file_ext = os.path.splitext(filename)[1].lower()
+        if file_ext == ".png":
+            attachments.append(("inline", f"{nonce}.png", filename))
+        elif file_ext == ".txt":
+            attachments.append(("attachment", f"{nonce}.txt", filename))
+
+    # Queue the email in the outbox, delivery happens after the scan or in the background
+    print(f"queueing notification to {to_address}")
+    return NOTIFIER.enqueue(
+        "URGENT NOTIFICATION - PythonMonitorScript",
+        html_template,
+        [to_address],
+        attachments,
     )
-    print(str(email_post.status_code))
-    print(str(email_post.text))
-    print(str(email_post.headers))
-    return email_post
 
 
 # get json object from the file
 def read_data_from_manifest():
-    tracking_manifest_file = open(os.path.join(scriptdir, "tracking.json"))
-    manifest = json.load(tracking_manifest_file)
-    return manifest
+    return get_tracking().data
 
 
-# write JSON object to the file
+# write JSON object to the file (batched, written once at the end of the run)
 def write_data_to_manifest(new_data):
-    try:
-        manifest_path = os.path.join(scriptdir, "tracking.json")
-
-        with open(manifest_path, "w") as tracking_file:
-            json.dump(new_data, tracking_file, indent=2)
-
-    except Exception as ex:
-        print("write_data_to_manifest exception:", ex)
+    get_tracking().replace(new_data)
 
 
 # get failed ticks from file storage
 def get_failed_ticks():
-    tracking_file_path = os.path.join(scriptdir, "tracking.json")
-
     try:
-        with open(tracking_file_path) as tracking_file:
-            current_json_tracking = json.load(tracking_file)
-            failed_ticks = int(current_json_tracking.get("failed_count", 0))
-    except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
-        # Handle file not found, JSON decode error, or invalid value gracefully
+        failed_ticks = int(read_data_from_manifest().get("failed_count", 0))
+    except (TypeError, ValueError) as e:
+        # Handle an invalid value gracefully
         print(f"Error reading tracking file: {e}")
         failed_ticks = 0
 
@@ -491,10 +1268,19 @@ def get_pretty_time(then, now=datetime.now(), interval="default"):
     }[interval]
 
 
-if __name__ == "__main__":
-    print("Reading data from config.ini")
-    PARSER.read("config.ini")
-    SCREENSHOTS_ENABLED = PARSER.getboolean("DEFAULT", "SCREENSHOTS_ENABLED")
+def create_screenshot_pool():
+    return ScreenshotPool(
+        launch_browser,
+        PARSER.get("DEFAULT", "TMP_PATH_SCREENSHOTS"),
+        workers=PARSER.getint("DEFAULT", "SCREENSHOT_WORKERS", fallback=2),
+        max_per_run=PARSER.getint("DEFAULT", "SCREENSHOT_MAX_PER_RUN", fallback=20),
+        page_timeout=PARSER.getfloat("DEFAULT", "SCREENSHOT_PAGE_TIMEOUT", fallback=10),
+    )
+
+
+def launch_browser():
+    # Selenium is only imported when the first screenshot is actually taken
+    from selenium import webdriver
 
     # Set up browser headless options
     options = webdriver.ChromeOptions()
@@ -503,66 +1289,490 @@ if __name__ == "__main__":
     options.add_argument(
         "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
     )
+    return webdriver.Chrome(options=options)
 
-    # Launch browser if screenshot capture is enabled
-    if SCREENSHOTS_ENABLED:
-        BROWSER = webdriver.Chrome(options=options)
 
-    # Run endpoint checks
-    do_heartbeat_check(get_website_dictionary())
+def handle_scan_results():
+    """
+    Updates incident tracking from the current ALERTS and sends the alert email
+    when the incident is due for one.
+    """
+    # Write this scan's results in one batch before the incident logic reads them back
+    if RESULTS_STORE:
+        try:
+            RESULTS_STORE.flush()
+            RESULTS_STORE.maybe_rollup()
+        except Exception as e:
+            print(f"Error writing results store: {e}")
 
-    # === POST-CHECK HANDLING ===
     if ALERTS:
         print(f"🔥 ALERTS detected: {len(ALERTS)} issue(s) found")
         tracking_info = update_incident_tracking(len(ALERTS))
-        duration_str = tracking_info["incident_duration"]
-        duration_minutes = int(duration_str.split("m")[0])
-        to_email = PARSER.get("DEFAULT", "ALERTS_EMAIL")
+    else:
+        # No alerts → incident resolved
+        tracking_info = update_incident_tracking(0)
+        if tracking_info["incident_active"] is False:
+            print("✅ Incident has been resolved. Tracking reset.")
+        else:
+            print("⚠️ ALERTS cleared, but tracking still active. This shouldn't happen.")
 
-        if duration_minutes >= 300:
+    if INCIDENTS is None:
+        save_state()
+        return
+
+    # Per-endpoint incidents decide what is worth an email, batched into one digest per window
+    INCIDENTS.update(ALERTS, CHECKED_ENDPOINTS, monitored=get_monitored_keys())
+    digest = INCIDENTS.digest()
+    if digest:
+        to_email = PARSER.get("DEFAULT", "ALERTS_EMAIL")
+        if INCIDENTS.oldest_open_seconds() >= 300 * 60:
             print("🚨 Escalation threshold reached (5+ hours). Switching to escalation email.")
             to_email = PARSER.get("DEFAULT", "ESCALATION_EMAIL")
 
-        # Email schedule rules
-        should_email = (
-            5 <= duration_minutes < 30
-            or (duration_minutes >= 30 and duration_minutes % 15 == 0)
+        print(
+            f"📧 Sending digest to {to_email}: {len(digest['new'])} new, "
+            f"{len(digest['ongoing'])} ongoing, {len(digest['recovered'])} recovered"
         )
-
-        if should_email:
-            print(f"📧 Sending alert email to {to_email}...")
+        referenced = set()
+        with METRICS.time_phase("email_render"):
+            markup = get_digest_markup(digest, referenced)
+        with METRICS.time_phase("email_queue"):
             send_urgent_email(
-                get_email_markup(),
+                markup,
                 tracking_info["failures_total"],
-                duration_str,
+                tracking_info["incident_duration"],
                 tracking_info["incident_start"],
                 to_email,
+                referenced,
             )
-        else:
-            print(f"⏳ Skipping email — incident active for {duration_str}")
+    elif ALERTS:
+        print(f"⏳ Skipping email — nothing new for this digest window ({tracking_info['incident_duration']} into the incident)")
 
-    else:
-        # No alerts → incident resolved
-        tracking_info = update_incident_tracking(0)
-        if tracking_info["incident_active"] is False:
-            print("✅ Incident has been resolved. Tracking reset.")
-        else:
-            print("⚠️ ALERTS cleared, but tracking still active. This shouldn't happen.")
+    save_state()
 
-    # Cleanup browser session
-    if SCREENSHOTS_ENABLED:
-        BROWSER.quit()
-
-    # Delete all temporary screenshot and HTML files
-    if SCREENSHOTS_ENABLED and SCREENSHOTS:
-        deleted = set()
-        for _, filename in SCREENSHOTS:
-            if filename and filename not in deleted:
-                deleted.add(filename)
+
+def prune_artifacts():
+    # Forgets artifacts of alerts that are gone and keeps the spool within its size budget
+    nonces = {alert.nonce for alert in ALERTS}
+    SCREENSHOTS[:] = [(nonce, filename) for nonce, filename in SCREENSHOTS if nonce in nonces]
+    if ARTIFACTS:
+        ARTIFACTS.prune(keep={filename for _, filename in SCREENSHOTS})
+
+
+def export_metrics():
+    # Write metrics for a node_exporter style textfile collector, if configured
+    path = PARSER.get("DEFAULT", "METRICS_TEXTFILE", fallback="")
+    if path:
+        try:
+            METRICS.write_textfile(path)
+        except Exception as e:
+            print(f"Error writing metrics file: {e}")
+
+
+def report_startup(marks):
+    # --profile-startup: time spent in each start-up step before the first check
+    print("Startup profile:")
+    previous = STARTUP_STARTED
+    for name, mark in marks:
+        print(f"   {name:<12} {(mark - previous) * 1000:8.1f} ms")
+        previous = mark
+    print(f"   {'total':<12} {(previous - STARTUP_STARTED) * 1000:8.1f} ms")
+
+
+def report_lazy_loads():
+    # Shows whether this run needed Selenium, worker processes or the collector's web server, and what it cost in memory
+    loaded = [name for name in ("selenium", "concurrent.futures.process", "aiohttp.web") if name in sys.modules]
+    browsers = SCREENSHOT_POOL.threads if SCREENSHOT_POOL else []
+    try:
+        # Unix only
+        import resource
+        peak_rss = f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB"
+    except ImportError:
+        peak_rss = "unknown"
+    print(
+        f"Lazily loaded: {', '.join(loaded) or 'nothing'}, {len(browsers)} screenshot worker(s) started, "
+        f"peak RSS {peak_rss}"
+    )
+
+
+def get_vantage_url():
+    # Set on vantage points, which report to a collector instead of alerting themselves
+    return PARSER.get("DEFAULT", "VANTAGE_COLLECTOR_URL", fallback="")
+
+
+def get_vantage_entries(pairs):
+    # One row per checked endpoint (and certificate check) with this scan's failures, empty if it passed
+    entries = {(site, endpoint): [] for site, endpoint in pairs}
+    for site in {site for site, _ in pairs}:
+        if f"{site}{TLS_ENDPOINT}" in CHECKED_ENDPOINTS:
+            entries[(site, TLS_ENDPOINT)] = []
+    for alert in ALERTS:
+        entries.setdefault((alert.site, alert.endpoint), []).append([alert.exception, alert.expected, alert.received, alert.detail])
+    return [[site, endpoint, failures] for (site, endpoint), failures in entries.items()]
+
+
+async def handle_vantage_results(entries):
+    """
+    Vantage point mode: pushes this scan's results (from get_vantage_entries) to the
+    collector, which raises alerts once a quorum of vantage points agree, then saves
+    local state.
+    """
+    from vantage import encode_batch, push_batch
+
+    if RESULTS_STORE:
+        try:
+            RESULTS_STORE.flush()
+            RESULTS_STORE.maybe_rollup()
+        except Exception as e:
+            print(f"Error writing results store: {e}")
+
+    failing = sum(1 for _, _, failures in entries if failures)
+    try:
+        with METRICS.time_phase("vantage_push"):
+            accepted = await push_batch(
+                get_vantage_url(),
+                encode_batch(PARSER.get("DEFAULT", "VANTAGE_NAME", fallback="") or socket.gethostname(), entries),
+                token=PARSER.get("DEFAULT", "VANTAGE_TOKEN", fallback="") or None,
+                timeout=PARSER.getfloat("DEFAULT", "VANTAGE_PUSH_TIMEOUT", fallback=10),
+            )
+        print(f"📡 Sent {len(entries)} result(s), {failing} failing, to the collector ({accepted} accepted)")
+    except Exception as e:
+        print(f"Error sending results to the collector: {e}")
+
+    save_state()
+
+
+async def run_collector():
+    """
+    Collector mode: merges the result batches vantage points push over HTTP or a Unix
+    socket, and every COLLECTOR_EVALUATE_INTERVAL seconds in which new batches arrived raises
+    alerts for the endpoints a quorum of them report as failing, through the usual incident
+    handling.
+    """
+    from vantage import QuorumAggregator, create_collector_app, start_collector
+
+    quorum = PARSER.get("DEFAULT", "VANTAGE_QUORUM", fallback="majority")
+    aggregator = QuorumAggregator(
+        quorum=quorum if quorum == "majority" else int(quorum),
+        max_age=PARSER.getfloat("DEFAULT", "VANTAGE_MAX_AGE", fallback=180),
+    )
+    listen = PARSER.get("DEFAULT", "COLLECTOR_LISTEN", fallback="127.0.0.1:9300")
+    interval = PARSER.getfloat("DEFAULT", "COLLECTOR_EVALUATE_INTERVAL", fallback=15)
+
+    # Batches received so far, incident handling only runs again once new results arrived
+    batches = [0]
+
+    def on_batch(vantage, count):
+        batches[0] += 1
+        METRICS.inc("monitor_vantage_results", count, vantage=vantage)
+
+    app = create_collector_app(aggregator, PARSER.get("DEFAULT", "VANTAGE_TOKEN", fallback="") or None, on_batch)
+    runner = await start_collector(app, listen)
+    print(f"📡 Collector listening on {listen}, alerting on a quorum of {quorum}")
+
+    # Delivers queued notifications until the collector stops
+    notifier_task = asyncio.create_task(NOTIFIER.run(metrics=METRICS)) if NOTIFIER else None
+
+    evaluated = 0
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            if batches[0] == evaluated:
+                continue
+            evaluated = batches[0]
+            failing, checked = aggregator.evaluate()
+            if not checked:
+                continue
+
+            ALERTS.clear()
+            CHECKED_ENDPOINTS.clear()
+            CHECKED_ENDPOINTS.update(f"{site}{endpoint}" for site, endpoint in checked)
+            for site, endpoint, failures, vantages in failing:
+                for failure in failures:
+                    # Vantage points from before assertion details send rows without one
+                    exception, expected, received = failure[:3]
+                    detail = failure[3] if len(failure) > 3 else None
+                    raise_alert(site, endpoint, exception, expected, received, None, None, capture=False, vantages=vantages, detail=detail)
+            print(f"📡 {len(checked)} endpoint(s) reported by {len(aggregator.vantages)} vantage point(s), {len(failing)} failing by quorum")
+            try:
+                handle_scan_results()
+            except Exception as e:
+                # A failed email or state write shouldn't stop the collector
+                print(f"Error handling scan results: {e}")
+            export_metrics()
+    finally:
+        if notifier_task:
+            notifier_task.cancel()
+        await runner.cleanup()
+
+
+def take_finished(done):
+    """
+    Daemon mode: moves the alerts and checked keys of the finished checks in done out of
+    ALERTS and CHECKED_ENDPOINTS, leaving those of checks that are still running.
+    Returns (alerts, checked) of the finished checks.
+    """
+    keys = {f"{site}{endpoint}" for site, endpoint in done}
+    alerts = [alert for alert in ALERTS if alert.key in keys]
+    ALERTS[:] = [alert for alert in ALERTS if alert.key not in keys]
+    checked = keys & CHECKED_ENDPOINTS
+    CHECKED_ENDPOINTS.difference_update(keys)
+    return alerts, checked
+
+
+async def run_daemon():
+    """
+    Keeps the process, connection pool and browser alive and checks each endpoint
+    on its own interval. Every due check runs as its own task, so a slow or retrying
+    endpoint never delays the others, and finished checks are handled in batches every
+    DAEMON_RESULT_INTERVAL seconds. sites.json is reloaded whenever its mtime changes.
+    """
+    scheduler = EndpointScheduler(
+        default_interval=PARSER.getfloat("DEFAULT", "DAEMON_DEFAULT_INTERVAL", fallback=60),
+        min_interval=PARSER.getfloat("DEFAULT", "DAEMON_MIN_INTERVAL", fallback=1),
+        spread=PARSER.getboolean("DEFAULT", "DAEMON_SPREAD", fallback=True),
+    )
+    result_interval = PARSER.getfloat("DEFAULT", "DAEMON_RESULT_INTERVAL", fallback=5)
+    sites = None
+
+    # Alerts for endpoints that are currently failing, carried between batches
+    failing = {}
+
+    # Check tasks by (site, endpoint) key, and the keys finished since the last batch
+    running = {}
+    finished = set()
+    background = set()
+    last_handled = time.monotonic()
+
+    async def run_check(keys, check):
+        # Alerts of an earlier run whose batch wasn't handled yet are replaced once this run
+        # finishes, so a batch holds the latest result of every endpoint once
+        names = {f"{site}{endpoint}" for site, endpoint in keys}
+        previous = {id(alert) for alert in ALERTS if alert.key in names}
+        try:
+            await check
+        except Exception as e:
+            print(f"Error checking {', '.join(site + endpoint for site, endpoint in keys)}: {e}")
+        finally:
+            if previous:
+                ALERTS[:] = [alert for alert in ALERTS if id(alert) not in previous]
+            for key in keys:
+                running.pop(key, None)
+            finished.update(keys)
+
+    async def bounded_check(sites, site, endpoint):
+        async with semaphore:
+            await do_endpoint_check(sites, site, endpoint, session)
+
+    # Notifications are delivered by a background task so a slow sink never holds up a check
+    if NOTIFIER:
+        # Kept in background with the vantage pushes, so it is referenced and cancelled on exit
+        background.add(asyncio.create_task(NOTIFIER.run(metrics=METRICS)))
+
+    session, semaphore = create_scan_session()
+    try:
+        async with session:
+            while True:
                 try:
-                    os.remove(filename)
-                    print(f"🧹 Deleted: {filename}")
-                except FileNotFoundError:
-                    print(f"⚠️ File not found (already deleted?): {filename}")
+                    latest = get_sites_config()
+                    if latest is not sites:
+                        sites = latest
+                        scheduler.load(sites, include=in_host_shard)
+                        # Changed host_limits get new limiters, those no longer used are dropped
+                        HOST_LIMITS.prune({(endpoint.origin, endpoint.host_limits) for endpoint in sites.enabled_endpoints})
+                        # Forget failures of endpoints that were removed or disabled
+                        for key in list(failing):
+                            if key not in scheduler.intervals:
+                                del failing[key]
+                        print(f"🔄 Loaded sites.json, {len(scheduler)} endpoint(s) scheduled")
                 except Exception as e:
-                    print(f"❌ Error deleting {filename}: {e}")
+                    print(f"Error reloading sites.json: {e}")
+
+                due = scheduler.pop_due() if sites else []
+                started = [key for key in due if key not in running]
+                if len(started) < len(due):
+                    print(f"⏳ {len(due) - len(started)} check(s) still running from their last turn, skipping this one")
+                for site, endpoint in started:
+                    running[(site, endpoint)] = asyncio.create_task(
+                        run_check([(site, endpoint)], bounded_check(sites, site, endpoint))
+                    )
+
+                # Certificates of the sites that were due, each origin probed once per TLS_PROBE_INTERVAL
+                tls_keys = [(site, TLS_ENDPOINT) for site in {site for site, _ in started} if (site, TLS_ENDPOINT) not in running]
+                if tls_keys:
+                    tls_sites = {site for site, _ in tls_keys}
+                    task = asyncio.create_task(
+                        run_check(tls_keys, check_tls(sites, [key for key in started if key[0] in tls_sites]))
+                    )
+                    for key in tls_keys:
+                        running[key] = task
+
+                if finished and time.monotonic() - last_handled >= result_interval:
+                    # Screenshots still being captured are picked up by a later batch
+                    collect_screenshots(wait=False)
+                    done = set(finished)
+                    finished.clear()
+                    last_handled = time.monotonic()
+
+                    # Nothing below awaits, so checks still running can't add alerts while the batch is handled
+                    alerts, checked = take_finished(done)
+                    in_flight = ALERTS[:]
+                    in_flight_checked = set(CHECKED_ENDPOINTS)
+
+                    if VANTAGE_MODE:
+                        # The collector alerts by quorum, this host only reports what it saw
+                        ALERTS[:] = alerts
+                        entries = get_vantage_entries([key for key in done if f"{key[0]}{key[1]}" in checked])
+                        push = asyncio.create_task(handle_vantage_results(entries))
+                        background.add(push)
+                        push.add_done_callback(background.discard)
+                    else:
+                        for key in done:
+                            failing.pop(key, None)
+                        for alert in alerts:
+                            failing.setdefault((alert.site, alert.endpoint), []).append(alert)
+
+                        # Incident handling sees every endpoint that is still failing, not just this batch
+                        ALERTS[:] = [alert for alerts in failing.values() for alert in alerts]
+                        CHECKED_ENDPOINTS.clear()
+                        CHECKED_ENDPOINTS.update(checked)
+                        try:
+                            handle_scan_results()
+                        except Exception as e:
+                            # A failed email or state write shouldn't stop the daemon
+                            print(f"Error handling scan results: {e}")
+
+                    ALERTS[:] = [alert for alerts in failing.values() for alert in alerts] + in_flight
+                    prune_artifacts()
+                    ALERTS[:] = in_flight
+                    CHECKED_ENDPOINTS.clear()
+                    CHECKED_ENDPOINTS.update(in_flight_checked)
+                    export_metrics()
+
+                await asyncio.sleep(min(scheduler.seconds_until_next(), 0.5 if finished else 1.0))
+    finally:
+        # Stops the notifier and any vantage pushes still in flight when the daemon exits
+        for task in list(background):
+            task.cancel()
+
+
+if __name__ == "__main__":
+    startup_marks = [("imports", IMPORTS_DONE)]
+    print("Reading data from config.ini")
+    PARSER.read("config.ini")
+    SCREENSHOTS_ENABLED = PARSER.getboolean("DEFAULT", "SCREENSHOTS_ENABLED")
+    VANTAGE_MODE = bool(get_vantage_url()) and not COLLECTOR_MODE
+    if VANTAGE_MODE or COLLECTOR_MODE:
+        # Alert emails come from the collector, which has no pages of its own to capture
+        SCREENSHOTS_ENABLED = False
+    startup_marks.append(("config.ini", time.perf_counter()))
+
+    # Overlapping cron runs would read and rewrite the same state: skip this run, or queue
+    # behind the running one for up to OVERLAP_WAIT_SECONDS, before any state is loaded
+    # --ack=<site><endpoint> acknowledges an incident so it drops out of reminder digests.
+    # Handled before the instance lock so it works while a daemon or collector holds it: the
+    # state file is updated under its own lock and the running process merges the change
+    ack_key = get_cli_value("ack")
+    if ack_key:
+        if open_incident_tracker().acknowledge_saved(ack_key):
+            print(f"Acknowledged incident for {ack_key}")
+        else:
+            print(f"No open incident for {ack_key}")
+        sys.exit(0)
+
+    # The collector runs next to a local vantage point's cron runs, so it has a lock of its own
+    lock_file = (
+        PARSER.get("DEFAULT", "COLLECTOR_LOCK_FILE", fallback="collector.lock")
+        if COLLECTOR_MODE
+        else PARSER.get("DEFAULT", "INSTANCE_LOCK_FILE", fallback="run.lock")
+    )
+    INSTANCE_LOCK = InstanceLock(os.path.join(scriptdir, lock_file))
+    overlap_policy = PARSER.get("DEFAULT", "OVERLAP_POLICY", fallback="skip")
+    overlap_wait = PARSER.getfloat("DEFAULT", "OVERLAP_WAIT_SECONDS", fallback=50) if overlap_policy == "queue" else 0
+    if not INSTANCE_LOCK.acquire(wait=overlap_wait):
+        print(f"Another run (pid {INSTANCE_LOCK.holder()}) is still in progress, skipping this one")
+        sys.exit(0)
+    startup_marks.append(("instance lock", time.perf_counter()))
+
+    # Scan state belongs to the vantage points, incidents and notifications to the collector
+    if not COLLECTOR_MODE:
+        RESULTS_STORE = open_results_store()
+        LATENCY_TRACKER = open_latency_tracker()
+        CIRCUITS = open_circuit_breakers()
+        RESPONSE_CACHE = open_response_cache()
+        ARTIFACTS = open_artifact_spool()
+        TLS_MONITOR = open_tls_monitor()
+    if not VANTAGE_MODE:
+        INCIDENTS = open_incident_tracker()
+        NOTIFIER = create_notifier()
+    startup_marks.append(("state files", time.perf_counter()))
+
+    metrics_port = PARSER.getint("DEFAULT", "METRICS_PORT", fallback=0)
+    if metrics_port:
+        METRICS.serve(metrics_port)
+
+    # Browsers are started by the screenshot workers on the first capture
+    if SCREENSHOTS_ENABLED:
+        SCREENSHOT_POOL = create_screenshot_pool()
+
+    # A collector only sees results pushed by vantage points and may have no sites.json
+    if not COLLECTOR_MODE:
+        get_sites_config()
+        startup_marks.append(("sites.json", time.perf_counter()))
+    METRICS.observe("monitor_phase_duration_seconds", time.perf_counter() - STARTUP_STARTED, phase="startup")
+    if PROFILE_STARTUP:
+        report_startup(startup_marks)
+
+    scan_finished = False
+    try:
+        if COLLECTOR_MODE:
+            print("Starting in collector mode")
+            asyncio.run(run_collector())
+        elif DAEMON_MODE:
+            print("Starting in daemon mode")
+            asyncio.run(run_daemon())
+        else:
+            # Run endpoint checks
+            with METRICS.time_phase("scan"):
+                if get_scan_workers() > 1:
+                    do_sharded_heartbeat_check(get_sites_config(), get_scan_workers())
+                elif use_concurrent_scan():
+                    do_concurrent_heartbeat_check(get_sites_config())
+                else:
+                    do_heartbeat_check(get_sites_config())
+            collect_screenshots()
+
+            # === POST-CHECK HANDLING ===
+            if VANTAGE_MODE:
+                asyncio.run(handle_vantage_results(get_vantage_entries(get_enabled_endpoints(get_sites_config()))))
+            else:
+                handle_scan_results()
+            scan_finished = True
+    except KeyboardInterrupt:
+        print("Stopping")
+    finally:
+        if PROFILE_STARTUP:
+            report_lazy_loads()
+
+        if RESULTS_STORE:
+            RESULTS_STORE.close()
+
+        # Cleanup browser sessions
+        if SCREENSHOT_POOL:
+            SCREENSHOT_POOL.shutdown()
+
+        # Artifacts stay in the spool for later runs until the size budget evicts them
+        prune_artifacts()
+
+        INSTANCE_LOCK.release()
+
+    if scan_finished:
+        # Deliver this run's notifications and anything left in the outbox by earlier runs.
+        # The instance lock is already released and the pass is capped by NOTIFY_DEADLINE,
+        # so a slow or failing sink never holds up the next scan
+        if NOTIFIER:
+            with METRICS.time_phase("email_send"):
+                asyncio.run(NOTIFIER.deliver_pending(
+                    deadline=PARSER.getfloat("DEFAULT", "NOTIFY_DEADLINE", fallback=30)
+                ))
+        export_metrics()
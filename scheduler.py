@@ -0,0 +1,88 @@
+import heapq
+import itertools
+import time
+
+
+class EndpointScheduler:
+    """
+    Min-heap of (due_time, site, endpoint) entries used by daemon mode.
+    Each endpoint runs on its own interval, taken from the endpoint entry in sites.json,
+    then the site entry, then the default interval.
+    """
+
+    def __init__(self, default_interval=60, min_interval=1, spread=True):
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.spread = spread
+        self.intervals = {}
+        self.heap = []
+        self.counter = itertools.count()
+
+    def get_interval(self, endpoint_config):
+        interval = endpoint_config.interval or self.default_interval
+        return max(self.min_interval, interval)
+
+    def load(self, sites, now=None, include=None):
+        """
+        Rebuilds the schedule from the compiled sites.json model, optionally limited
+        to the sites for which include(site) is true.
+        Endpoints that were already scheduled keep their next due time. New ones are due now,
+        or with spread, staggered across their interval per origin so a host with many
+        endpoints isn't hit by all of them at once.
+        """
+        now = time.monotonic() if now is None else now
+        next_due = {(site, endpoint): due for due, _, site, endpoint in self.heap}
+        new_per_origin = {}
+        if self.spread:
+            for endpoint_config in sites.enabled_endpoints:
+                if include is not None and not include(endpoint_config.site):
+                    continue
+                if (endpoint_config.site, endpoint_config.path) not in next_due:
+                    new_per_origin[endpoint_config.origin] = new_per_origin.get(endpoint_config.origin, 0) + 1
+        placed = {}
+
+        self.intervals = {}
+        self.heap = []
+        for endpoint_config in sites.enabled_endpoints:
+            if include is not None and not include(endpoint_config.site):
+                continue
+            key = (endpoint_config.site, endpoint_config.path)
+            interval = self.get_interval(endpoint_config)
+            self.intervals[key] = interval
+            if key in next_due:
+                due = min(next_due[key], now + interval)
+            elif self.spread:
+                index = placed.get(endpoint_config.origin, 0)
+                placed[endpoint_config.origin] = index + 1
+                due = now + interval * index / new_per_origin[endpoint_config.origin]
+            else:
+                due = now
+            self.heap.append((due, next(self.counter), endpoint_config.site, endpoint_config.path))
+
+        heapq.heapify(self.heap)
+
+    def pop_due(self, now=None):
+        # Pop every endpoint that is due and put it back on the heap for its next run
+        now = time.monotonic() if now is None else now
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due_time, _, site, endpoint = heapq.heappop(self.heap)
+            interval = self.intervals[(site, endpoint)]
+
+            # Don't try to catch up on missed runs if a scan overran its interval
+            next_time = due_time + interval
+            if next_time <= now:
+                next_time = now + interval
+
+            heapq.heappush(self.heap, (next_time, next(self.counter), site, endpoint))
+            due.append((site, endpoint))
+        return due
+
+    def seconds_until_next(self, now=None):
+        now = time.monotonic() if now is None else now
+        if not self.heap:
+            return self.default_interval
+        return max(0.0, self.heap[0][0] - now)
+
+    def __len__(self):
+        return len(self.heap)
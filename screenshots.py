@@ -0,0 +1,132 @@
+import queue
+import threading
+import time
+
+
+class ScreenshotPool:
+    """
+    Captures screenshots on a pool of headless browser worker threads so that
+    endpoint checks only ever enqueue a job and never wait on Selenium.
+    Each worker launches its own browser on its first job and keeps it for reuse.
+    """
+
+    def __init__(self, browser_factory, path, workers=2, max_per_run=20, page_timeout=10):
+        self.browser_factory = browser_factory
+        self.path = path
+        self.workers = workers
+        self.max_per_run = max_per_run
+        self.page_timeout = page_timeout
+
+        self.jobs = queue.Queue()
+        self.results = []
+        self.threads = []
+        self.submitted = 0
+        self.pending = 0
+        self.condition = threading.Condition()
+
+    def submit(self, nonce, url):
+        # Returns False once the per-run cap is reached
+        with self.condition:
+            if self.submitted >= self.max_per_run:
+                return False
+            self.submitted += 1
+            self.pending += 1
+
+        if not self.threads:
+            self.start()
+        self.jobs.put((nonce, url))
+        return True
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.worker, name=f"screenshot-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def worker(self):
+        browser = None
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+
+            nonce, url = job
+            filename = f"{self.path}/screenshot_{nonce}.png"
+            try:
+                if browser is None:
+                    browser = self.browser_factory()
+                    browser.set_page_load_timeout(self.page_timeout)
+                self.capture(browser, url, filename)
+                with self.condition:
+                    self.results.append((nonce, filename))
+            except Exception as e:
+                print(f"Error taking screenshot of {url}: {e}")
+            finally:
+                with self.condition:
+                    self.pending -= 1
+                    self.condition.notify_all()
+
+        if browser is not None:
+            browser.quit()
+
+    def capture(self, browser, url, filename):
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        try:
+            browser.get(url)
+            # Wait for the page to finish loading instead of sleeping a fixed amount
+            WebDriverWait(browser, self.page_timeout).until(
+                lambda driver: driver.execute_script("return document.readyState") == "complete"
+            )
+        except Exception as e:
+            print(f"Error accessing {url}: {e}")
+        browser.save_screenshot(filename)
+
+    def drain(self, budget=30):
+        """
+        Waits up to budget seconds for queued screenshots, drops whatever has not started
+        by then, and returns the (nonce, filename) pairs captured since the last drain.
+        """
+        deadline = time.monotonic() + budget
+        with self.condition:
+            while self.pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+        dropped = 0
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                dropped += 1
+        if dropped:
+            print(f"⏱️ Screenshot time budget exceeded, skipped {dropped} screenshot(s)")
+
+        with self.condition:
+            self.pending -= dropped
+            results, self.results = self.results, []
+            self.submitted = 0
+        return results
+
+    def collect(self):
+        """
+        Returns the (nonce, filename) pairs captured since the last call without waiting,
+        queued and running screenshots carry over to a later call. The per-run cap starts
+        over once nothing is queued or running.
+        """
+        with self.condition:
+            results, self.results = self.results, []
+            if self.pending == 0:
+                self.submitted = 0
+        return results
+
+    def shutdown(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join(timeout=self.page_timeout)
+        self.threads = []
@@ -0,0 +1,237 @@
+import json
+import os
+import pickle
+from urllib.parse import urlsplit
+
+from assertions import Assertions, AssertionConfigError
+
+CACHE_VERSION = 5
+
+
+class SitesConfigError(ValueError):
+    pass
+
+
+class EndpointConfig:
+    """
+    One endpoint from sites.json, validated once at load time.
+    Optional settings are None when not set so callers can apply config.ini defaults.
+    """
+
+    __slots__ = (
+        "site",
+        "path",
+        "url",
+        "status",
+        "dom_contains",
+        "interval",
+        "timeout",
+        "max_body_bytes",
+        "skip_body",
+        "warn_latency_ms",
+        "max_latency_ms",
+        "assertions",
+        "origin",
+        "host_limits",
+    )
+
+    def __init__(self, site, path, data, site_interval=None, base_url=None):
+        where = f"{site}{path}"
+        if not isinstance(data, dict):
+            raise SitesConfigError(f"{where}: endpoint must be an object")
+
+        self.site = site
+        self.path = path
+        self.url = f"{base_url or 'https://' + site}{path}"
+        self.status = require_number(where, "status", data.get("status"), int)
+        self.dom_contains = data.get("dom_contains") or None
+        if self.dom_contains is not None and not isinstance(self.dom_contains, str):
+            raise SitesConfigError(f"{where}: dom_contains must be a string")
+
+        self.interval = optional_number(where, "interval", data.get("interval", site_interval), float)
+        self.timeout = optional_number(where, "timeout", data.get("timeout"), float)
+        self.max_body_bytes = optional_number(where, "max_body_bytes", data.get("max_body_bytes"), int)
+        self.skip_body = bool(data.get("skip_body", False))
+        self.warn_latency_ms = optional_number(where, "warn_latency_ms", data.get("warn_latency_ms"), float)
+        self.max_latency_ms = optional_number(where, "max_latency_ms", data.get("max_latency_ms"), float)
+        self.assertions = compile_assertions(where, data, self.dom_contains)
+
+        # scheme://host:port, the unit that per-host limits and spreading apply to
+        parts = urlsplit(self.url)
+        self.origin = f"{parts.scheme}://{parts.netloc.lower()}"
+        # (concurrency, rate, burst) for the origin, filled in by SitesConfig
+        self.host_limits = None
+
+
+class SiteConfig:
+    __slots__ = ("name", "check", "interval", "base_url", "host_limits", "endpoints", "num_checks")
+
+    def __init__(self, name, data):
+        if not isinstance(data, dict):
+            raise SitesConfigError(f"{name}: site must be an object")
+        endpoints = data.get("endpoints")
+        if not isinstance(endpoints, dict):
+            raise SitesConfigError(f"{name}: endpoints must be an object")
+
+        self.name = name
+        self.check = bool(data.get("check", True))
+        self.interval = optional_number(name, "interval", data.get("interval"), float)
+
+        # Scheme, host and port to check instead of https://<site>, e.g. a staging or local server
+        self.base_url = data.get("base_url") or None
+        if self.base_url is not None:
+            if not isinstance(self.base_url, str) or not self.base_url.startswith(("http://", "https://")):
+                raise SitesConfigError(f"{name}: base_url must start with http:// or https://")
+            self.base_url = self.base_url.rstrip("/")
+
+        self.host_limits = compile_host_limits(name, data.get("host_limits"))
+        self.endpoints = {
+            path: EndpointConfig(name, path, endpoint, self.interval, self.base_url) for path, endpoint in endpoints.items()
+        }
+        self.num_checks = len(self.endpoints)
+
+
+class SitesConfig:
+    """
+    Compiled sites.json. enabled_endpoints lists every endpoint of every site with check
+    enabled, in file order, so a scan never has to walk the nested dictionaries.
+    """
+
+    __slots__ = ("sites", "enabled_endpoints", "mtime_ns", "size")
+
+    def __init__(self, data, mtime_ns=None, size=None):
+        if not isinstance(data, dict) or not isinstance(data.get("sites"), dict):
+            raise SitesConfigError("sites.json must contain a \"sites\" object")
+
+        self.sites = {name: SiteConfig(name, site) for name, site in data["sites"].items()}
+        self.enabled_endpoints = [
+            endpoint for site in self.sites.values() if site.check for endpoint in site.endpoints.values()
+        ]
+        self.mtime_ns = mtime_ns
+        self.size = size
+
+        # Sites that share an origin (e.g. through base_url) share its limits, the strictest wins
+        origin_limits = {}
+        for site in self.sites.values():
+            if site.host_limits is None:
+                continue
+            for endpoint in site.endpoints.values():
+                origin_limits[endpoint.origin] = strictest_limits(origin_limits.get(endpoint.origin), site.host_limits)
+        for site in self.sites.values():
+            for endpoint in site.endpoints.values():
+                endpoint.host_limits = origin_limits.get(endpoint.origin)
+
+    def endpoint(self, site, path):
+        return self.sites[site].endpoints[path]
+
+    def get_num_of_checks(self, site):
+        return self.sites[site].num_checks if site in self.sites else 0
+
+    def __len__(self):
+        return len(self.enabled_endpoints)
+
+
+def compile_assertions(where, data, dom_contains):
+    # Returns None for endpoints that only check the status code
+    contains = string_list(where, "contains", data.get("contains"))
+    not_contains = string_list(where, "not_contains", data.get("not_contains"))
+    matches = string_list(where, "matches", data.get("matches"))
+    json_checks = data.get("json")
+    headers = data.get("headers")
+    if json_checks is not None and not isinstance(json_checks, dict):
+        raise SitesConfigError(f"{where}: json must be an object of path: value")
+    if headers is not None and (
+        not isinstance(headers, dict) or not all(isinstance(v, (str, bool)) for v in headers.values())
+    ):
+        raise SitesConfigError(f"{where}: headers must map names to a string, true or false")
+
+    if not (dom_contains or contains or not_contains or matches or json_checks or headers):
+        return None
+    try:
+        return Assertions(dom_contains, contains, not_contains, matches, json_checks, headers)
+    except AssertionConfigError as e:
+        raise SitesConfigError(f"{where}: {e}")
+
+
+def compile_host_limits(where, data):
+    """
+    Returns (concurrency, rate, burst) from a site's "host_limits" object, or None.
+    Settings left out are None so the config.ini defaults apply.
+    """
+    if data is None:
+        return None
+    if not isinstance(data, dict):
+        raise SitesConfigError(f"{where}: host_limits must be an object")
+    concurrency = optional_number(where, "host_limits.concurrency", data.get("concurrency"), int)
+    rate = optional_number(where, "host_limits.rate", data.get("rate"), float)
+    burst = optional_number(where, "host_limits.burst", data.get("burst"), int)
+    if concurrency is not None and concurrency < 1:
+        raise SitesConfigError(f"{where}: host_limits.concurrency must be at least 1")
+    if rate is not None and rate <= 0:
+        raise SitesConfigError(f"{where}: host_limits.rate must be greater than 0")
+    if burst is not None and burst < 1:
+        raise SitesConfigError(f"{where}: host_limits.burst must be at least 1")
+    return concurrency, rate, burst
+
+
+def strictest_limits(current, limits):
+    if current is None:
+        return limits
+    return tuple(b if a is None else a if b is None else min(a, b) for a, b in zip(current, limits))
+
+
+def string_list(where, name, value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise SitesConfigError(f"{where}: {name} must be a string or a list of strings")
+    return value
+
+
+def require_number(where, name, value, kind):
+    number = optional_number(where, name, value, kind)
+    if number is None:
+        raise SitesConfigError(f"{where}: {name} is required")
+    return number
+
+
+def optional_number(where, name, value, kind):
+    if value is None:
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise SitesConfigError(f"{where}: {name} must be a number, got {value!r}")
+
+
+def load_sites_config(path, cache_path=None):
+    """
+    Loads and validates sites.json. When cache_path is set, the compiled model is
+    pickled there and reused for as long as sites.json keeps the same mtime and size.
+    """
+    stat = os.stat(path)
+
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                version, mtime_ns, size, config = pickle.load(f)
+            if (version, mtime_ns, size) == (CACHE_VERSION, stat.st_mtime_ns, stat.st_size):
+                return config
+        except Exception as e:
+            print(f"Ignoring sites cache: {e}")
+
+    with open(path, "r") as f:
+        config = SitesConfig(json.load(f), stat.st_mtime_ns, stat.st_size)
+
+    if cache_path:
+        tmp_path = f"{cache_path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump((CACHE_VERSION, stat.st_mtime_ns, stat.st_size, config), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"Error writing sites cache: {e}")
+
+    return config
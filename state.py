@@ -0,0 +1,137 @@
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, locking is skipped there
+    fcntl = None
+
+
+def atomic_write_json(path, data, indent=None):
+    """
+    Writes data as JSON to a unique temp file in the same directory, flushes it to disk
+    and renames it over path, so readers see either the old or the new file, never a
+    truncated one, and overlapping writers can't clobber each other's temp file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def locked(path, shared=False):
+    # Holds an flock on path.lock for a read-modify-write of path
+    with open(f"{path}.lock", "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class InstanceLock:
+    """
+    Single-instance guard for overlapping cron runs, an flock held for the life of the
+    process (the kernel releases it if the process dies). acquire() returns False when
+    another run holds the lock, right away or after waiting up to wait seconds.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self, wait=0, poll=0.5):
+        self.file = open(self.path, "a+")
+        if fcntl is None:
+            return True
+
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    self.file.close()
+                    self.file = None
+                    return False
+                time.sleep(poll)
+
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(f"{os.getpid()}\n")
+        self.file.flush()
+        return True
+
+    def holder(self):
+        try:
+            with open(self.path, "r") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def release(self):
+        if self.file is None:
+            return
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+
+
+class StateFile:
+    """
+    JSON state (tracking.json) loaded once per run and written back once.
+    Changes are made to .data in memory and marked with touch(); save() writes them
+    atomically under an flock, and only if something changed.
+    """
+
+    def __init__(self, path, default=None):
+        self.path = path
+        self.default = default or {}
+        self.dirty = False
+        self.data = self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return dict(self.default)
+        try:
+            with locked(self.path, shared=True), open(self.path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading {os.path.basename(self.path)}: {e}")
+            return dict(self.default)
+
+    def replace(self, data):
+        self.data = data
+        self.dirty = True
+
+    def touch(self):
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            with locked(self.path):
+                atomic_write_json(self.path, self.data, indent=2)
+            self.dirty = False
+        except Exception as e:
+            print(f"Error writing {os.path.basename(self.path)}: {e}")
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+import socket
+import ssl
+import time
+from urllib.parse import urlsplit
+
+from state import atomic_write_json
+
+
+class TLSMonitor:
+    """
+    Certificate expiry, chain validity and handshake time per HTTPS origin, persisted
+    between runs in a JSON file. Each origin is probed at most once every probe_interval
+    seconds, however many endpoints it serves; in between, the stored result is used.
+    """
+
+    def __init__(self, path, probe_interval=3600, warn_days=14, timeout=10):
+        self.path = path
+        self.probe_interval = probe_interval
+        self.warn_days = warn_days
+        self.timeout = timeout
+        self.origins = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                self.origins = json.load(f)
+        except Exception as e:
+            print(f"Error loading TLS state: {e}")
+
+    def save(self):
+        try:
+            atomic_write_json(self.path, self.origins, indent=2)
+        except Exception as e:
+            print(f"Error writing TLS state: {e}")
+
+    def probe_due(self, origin, now=None):
+        now = time.time() if now is None else now
+        entry = self.origins.get(origin)
+        return entry is None or now - entry["checked_at"] >= self.probe_interval
+
+    async def probe(self, origin, resolver=None):
+        """
+        Connects to the origin, times the TLS handshake on its own and stores the verified
+        certificate's expiry and issuer, or why verification failed. Returns the entry.
+        """
+        parts = urlsplit(origin)
+        host, port = parts.hostname, parts.port or 443
+        entry = {"checked_at": time.time(), "handshake_ms": None, "expires_at": None, "issuer": None, "error": None}
+
+        writer = None
+        try:
+            address = host
+            if resolver is not None:
+                address = (await resolver.resolve(host, port, socket.AF_UNSPEC))[0]["host"]
+            _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), self.timeout)
+
+            started = time.monotonic()
+            await asyncio.wait_for(
+                writer.start_tls(ssl.create_default_context(), server_hostname=host), self.timeout
+            )
+            entry["handshake_ms"] = (time.monotonic() - started) * 1000
+
+            cert = writer.get_extra_info("ssl_object").getpeercert()
+            entry["expires_at"] = ssl.cert_time_to_seconds(cert["notAfter"])
+            issuer = dict(pair[0] for pair in cert.get("issuer", ()))
+            entry["issuer"] = issuer.get("organizationName") or issuer.get("commonName")
+        except ssl.SSLCertVerificationError as e:
+            entry["error"] = f"Certificate verification failed: {e.verify_message}"
+            entry["invalid"] = True
+        except Exception as e:
+            # Unreachable hosts already fail their endpoint checks, this isn't a certificate problem
+            entry["error"] = f"TLS probe failed: {e or type(e).__name__}"
+        finally:
+            if writer is not None:
+                writer.close()
+
+        self.origins[origin] = entry
+        return entry
+
+    def failures(self, origin, now=None):
+        # Returns (exception, expected, received) for certificate problems of the origin
+        entry = self.origins.get(origin)
+        if entry is None:
+            return []
+        if entry.get("invalid"):
+            return [(entry["error"], "valid certificate chain", "invalid")]
+        if entry["expires_at"] is None:
+            return []
+
+        now = time.time() if now is None else now
+        days = int((entry["expires_at"] - now) // 86400)
+        if days < 0:
+            return [(f"Certificate expired {-days} day{'s' if days != -1 else ''} ago", self.warn_days, days)]
+        if days <= self.warn_days:
+            return [(f"Certificate expires in {days} day{'s' if days != 1 else ''}", self.warn_days, days)]
+        return []
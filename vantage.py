@@ -0,0 +1,147 @@
+import hmac
+import json
+import time
+
+import aiohttp
+
+TOKEN_HEADER = "X-Vantage-Token"
+
+
+def encode_batch(vantage, entries):
+    """
+    Compact result batch sent by a vantage point: one [site, endpoint, failures] row per
+    checked endpoint, where failures is a list of [exception, expected, received, detail]
+    and is empty when the check passed.
+    """
+    return json.dumps(
+        {"vantage": vantage, "sent_at": time.time(), "results": entries},
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+async def push_batch(url, body, token=None, timeout=10):
+    """
+    POSTs a batch to the collector at url, either http://host:port or unix:/path/to.sock.
+    Returns the number of results the collector accepted.
+    """
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers[TOKEN_HEADER] = token
+    if url.startswith("unix:"):
+        connector = aiohttp.UnixConnector(path=url[len("unix:"):])
+        url = "http://collector"
+    else:
+        connector = None
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async with session.post(
+            f"{url.rstrip('/')}/results",
+            data=body,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["accepted"]
+
+
+class QuorumAggregator:
+    """
+    Latest result of every endpoint from every vantage point. An endpoint is failing only
+    when at least quorum of the vantage points with a result newer than max_age report a
+    failure, so a network problem near one monitor host doesn't look like an outage.
+    quorum is a number of vantage points or "majority".
+    """
+
+    def __init__(self, quorum="majority", max_age=180):
+        self.quorum = quorum
+        self.max_age = max_age
+        self.results = {}
+        self.vantages = {}
+
+    def add_batch(self, batch, now=None):
+        # Returns the number of results merged
+        now = time.time() if now is None else now
+        vantage = str(batch["vantage"])
+        self.vantages[vantage] = now
+        results = self.results
+        for site, endpoint, failures in batch["results"]:
+            entry = results.get((site, endpoint))
+            if entry is None:
+                entry = results[(site, endpoint)] = {}
+            entry[vantage] = (now, failures)
+        return len(batch["results"])
+
+    def required(self, reporting):
+        if self.quorum == "majority":
+            return reporting // 2 + 1
+        return int(self.quorum)
+
+    def evaluate(self, now=None):
+        """
+        Returns (failing, checked). failing lists (site, endpoint, failures, vantages) for
+        endpoints that reached quorum, with the failures reported by the first agreeing
+        vantage point. checked holds every endpoint with at least one fresh result.
+        Endpoints without fresh results are forgotten.
+        """
+        now = time.time() if now is None else now
+        oldest = now - self.max_age
+        failing = []
+        checked = []
+        for key, entry in list(self.results.items()):
+            fresh = {vantage: failures for vantage, (received_at, failures) in entry.items() if received_at >= oldest}
+            if not fresh:
+                del self.results[key]
+                continue
+            checked.append(key)
+            failed = sorted(vantage for vantage, failures in fresh.items() if failures)
+            if failed and len(failed) >= self.required(len(fresh)):
+                failing.append((key[0], key[1], fresh[failed[0]], tuple(failed)))
+        return failing, checked
+
+
+def create_collector_app(aggregator, token=None, on_batch=None):
+    """
+    aiohttp app receiving batches on POST /results. With token set, batches must carry it
+    in the X-Vantage-Token header. on_batch(vantage, count) is called for every batch.
+    """
+    # Only the collector serves HTTP, vantage points don't pay for importing the server
+    from aiohttp import web
+
+    async def receive(request):
+        if token and not hmac.compare_digest(request.headers.get(TOKEN_HEADER, ""), token):
+            raise web.HTTPUnauthorized()
+        try:
+            batch = json.loads(await request.read())
+            count = aggregator.add_batch(batch)
+        except (ValueError, KeyError, TypeError) as e:
+            raise web.HTTPBadRequest(text=f"Invalid batch: {e}")
+        if on_batch:
+            on_batch(batch["vantage"], count)
+        return web.json_response({"accepted": count})
+
+    async def status(request):
+        now = time.time()
+        return web.json_response({
+            "endpoints": len(aggregator.results),
+            "vantages": {vantage: round(now - seen, 1) for vantage, seen in aggregator.vantages.items()},
+        })
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/results", receive)
+    app.router.add_get("/status", status)
+    return app
+
+
+async def start_collector(app, listen):
+    # Serves app on host:port or unix:/path/to.sock, returns the runner to clean up
+    from aiohttp import web
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    if listen.startswith("unix:"):
+        site = web.UnixSite(runner, listen[len("unix:"):])
+    else:
+        host, _, port = listen.rpartition(":")
+        site = web.TCPSite(runner, host or "127.0.0.1", int(port))
+    await site.start()
+    return runner